@@ -1,3 +1,7 @@
+import functools
+import io
+import json
+import sys
 import time
 from enum import Enum
 
@@ -6,6 +10,7 @@ from termcolor import colored
 
 from airiam.banner import banner
 from airiam.models import RuntimeReport
+from airiam.models.ConsolidatedReport import ConsolidatedReport
 from airiam.version import version
 
 init(autoreset=True)
@@ -13,111 +18,267 @@ init(autoreset=True)
 
 class OutputFormat(Enum):
     cli = 'CLI'
+    json = 'JSON'
+    jsonl = 'JSON Lines'
+    sarif = 'SARIF'
+
+    def __str__(self):
+        return self.name
+
+    @staticmethod
+    def from_name(name: str):
+        try:
+            return OutputFormat[name]
+        except KeyError:
+            raise ValueError(f'Unknown output format {name}')
+
+
+# The type of every finding in RuntimeReport.get_unused(), keyed by the report's key
+FINDING_TYPES = {
+    'Users': 'UnusedUser',
+    'UnusedActiveAccessKeys': 'UnusedActiveAccessKey',
+    'UnusedConsoleLoginProfiles': 'UnusedConsoleLoginProfile',
+    'Roles': 'UnusedRole',
+    'Groups': 'RedundantGroup',
+    'Policies': 'UnattachedPolicy',
+    'PolicyAttachments': 'UnusedPolicyAttachment'
+}
+SARIF_SCHEMA = 'https://json.schemastore.org/sarif-2.1.0.json'
+SARIF_RULES = {
+    'UnusedUser': 'IAM user which isn\'t being used',
+    'UnusedActiveAccessKey': 'Active access key which isn\'t being used',
+    'UnusedConsoleLoginProfile': 'Password access to the AWS console which isn\'t being used',
+    'UnusedRole': 'IAM role which isn\'t being used',
+    'RedundantGroup': 'IAM group with no members or no policies',
+    'UnattachedPolicy': 'IAM policy which isn\'t attached to any user, group or role',
+    'UnusedPolicyAttachment': 'Policy attachment whose privileges aren\'t being used'
+}
 
 
 class Reporter:
     @staticmethod
-    def report_unused(runtime_results: RuntimeReport) -> None:
-        print(f'Identifying unused IAM entities in the account...\n')
-        time.sleep(2)
+    def report_unused(runtime_results: RuntimeReport, interactive=False) -> None:
+        """
+        Prints the unused entities. By default the report is rendered into a buffer which is then written at once, while the interactive
+        mode prints it section by section, pausing between the sections
+        :param runtime_results: The report, either of a single account or a consolidated one, which is reported account by account
+        :param interactive:     Whether to pause between the sections. Ignored when stdout isn't a terminal
+        """
+        interactive = interactive and sys.stdout.isatty()
+        output = sys.stdout if interactive else io.StringIO()
+        echo = functools.partial(print, file=output)
+        pause = functools.partial(Reporter._pause, interactive)
+        try:
+            if isinstance(runtime_results, ConsolidatedReport):
+                for report in runtime_results.get_reports():
+                    echo(colored(f'Account {report.account_id}', attrs=['bold', 'underline']) + '\n')
+                    Reporter._report_unused(report, echo, pause)
+            else:
+                Reporter._report_unused(runtime_results, echo, pause)
+            echo('If you prefer to to change the current runtime and not move to IaC but the number of entities above is intimidating - consider '
+                 'using our playbooks, available at: ')
+            echo('https://www.bridgecrew.io/')
+        finally:
+            if not interactive:
+                sys.stdout.write(output.getvalue())
+                sys.stdout.flush()
+
+    @staticmethod
+    def _pause(interactive: bool, seconds: int) -> None:
+        if interactive:
+            sys.stdout.flush()
+            time.sleep(seconds)
+
+    @staticmethod
+    def _report_unused(runtime_results: RuntimeReport, echo, pause) -> None:
+        echo(f'Identifying unused IAM entities in the account...\n')
+        pause(2)
         unused = runtime_results.get_unused()
         unused_users = unused['Users']
         if len(unused_users) > 0:
-            print(colored(f'The following {len(unused_users)} users were found to be unused:', 'yellow', attrs=['bold']))
+            echo(colored(f'The following {len(unused_users)} users were found to be unused:', 'yellow', attrs=['bold']))
             for user in unused_users:
                 if user["LastUsed"] == -1:
                     ending = "Never used!"
                 else:
                     ending = "last used {} days ago".format(user["LastUsed"])
-                print(colored('Unused: ', 'red', attrs=['bold']) + f'{user["UserName"]}: {ending}')
-            time.sleep(5)
+                echo(colored('Unused: ', 'red', attrs=['bold']) + f'{user["UserName"]}: {ending}')
+            pause(5)
         else:
-            print(colored('No unused users were found in the account! Hurray!', color='green'))
+            echo(colored('No unused users were found in the account! Hurray!', color='green'))
 
-        print()
+        echo()
         unused_access_keys = unused['UnusedActiveAccessKeys']
         if len(unused_access_keys) > 0:
-            print(colored(f'The following {len(unused_access_keys)} active access keys aren\'t being used:', 'yellow', attrs=['bold']))
+            echo(colored(f'The following {len(unused_access_keys)} active access keys aren\'t being used:', 'yellow', attrs=['bold']))
             for access_key_obj in unused_access_keys:
-                print(colored('Unused: ', 'red', attrs=['bold'])
-                      + f'{access_key_obj["User"]} used access key #{access_key_obj["AccessKey"]} {access_key_obj["DaysSinceLastUse"]} days ago')
-            time.sleep(5)
+                echo(colored('Unused: ', 'red', attrs=['bold'])
+                     + f'{access_key_obj["User"]} used access key #{access_key_obj["AccessKey"]} {access_key_obj["DaysSinceLastUse"]} days ago')
+            pause(5)
         else:
-            print(colored('No unused access keys were found in the account! Hurray!', color='green'))
+            echo(colored('No unused access keys were found in the account! Hurray!', color='green'))
 
-        print()
+        echo()
         unused_console_login_profiles = unused['UnusedConsoleLoginProfiles']
         if len(unused_console_login_profiles) > 0:
-            print(colored(f'The following {len(unused_console_login_profiles)} users have password access they aren\'t using:', 'yellow', attrs=['bold']))
+            echo(colored(f'The following {len(unused_console_login_profiles)} users have password access they aren\'t using:', 'yellow', attrs=['bold']))
             for console_login_profile in unused_console_login_profiles:
                 has_mfa = console_login_profile['MFAEnabled']
                 if has_mfa:
-                    print(colored(console_login_profile['User'], 'yellow', attrs=['bold'])
-                          + ' has password access to the AWS console (with MFA) but hasn\'t used it in the last '
-                          + f'{console_login_profile["DaysSinceLastUse"]} days')
+                    echo(colored(console_login_profile['User'], 'yellow', attrs=['bold'])
+                         + ' has password access to the AWS console (with MFA) but hasn\'t used it in the last '
+                         + f'{console_login_profile["DaysSinceLastUse"]} days')
                 else:
-                    print(colored(console_login_profile['User'], 'red', attrs=['bold'])
-                          + f' has password access to the AWS console ' + colored('WITHOUT MFA', 'red')
-                          + f' but hasn\'t used it in the last {console_login_profile["DaysSinceLastUse"]} days')
-            time.sleep(5)
+                    echo(colored(console_login_profile['User'], 'red', attrs=['bold'])
+                         + f' has password access to the AWS console ' + colored('WITHOUT MFA', 'red')
+                         + f' but hasn\'t used it in the last {console_login_profile["DaysSinceLastUse"]} days')
+            pause(5)
         else:
-            print(colored('No unused Console Login Profiles were found in the account! Hurray!', color='green'))
+            echo(colored('No unused Console Login Profiles were found in the account! Hurray!', color='green'))
 
-        print()
+        echo()
         unused_roles = unused['Roles']
         if len(unused_roles) > 0:
-            print(colored(f'The following {len(unused_roles)} roles are unused:', 'yellow', attrs=['bold']))
+            echo(colored(f'The following {len(unused_roles)} roles are unused:', 'yellow', attrs=['bold']))
             for role in unused_roles:
                 if role['LastUsed'] == -1:
                     ending = "Never used!"
                 else:
                     ending = "last used {} days ago".format(role['LastUsed'])
-                print(colored('Unused: ', 'red', attrs=['bold']) + f'{role["RoleName"]}: {ending}')
-            time.sleep(5)
+                echo(colored('Unused: ', 'red', attrs=['bold']) + f'{role["RoleName"]}: {ending}')
+            pause(5)
         else:
-            print(colored('No unused roles were found in the account! Hurray!', color='green'))
+            echo(colored('No unused roles were found in the account! Hurray!', color='green'))
 
-        print()
+        echo()
         unused_groups = unused['Groups']
         if len(unused_groups) > 0:
-            print(colored(f'The following {len(unused_groups)} groups are redundant:', 'yellow', attrs=['bold']))
+            echo(colored(f'The following {len(unused_groups)} groups are redundant:', 'yellow', attrs=['bold']))
             for group in unused_groups:
                 if len(group['AttachedManagedPolicies'] + group['GroupPolicyList']) == 0:
                     msg = ' has no policies attached to it'
                 else:
                     msg = ' has no members'
-                print(colored(group['GroupName'], 'yellow', attrs=['bold']) + msg)
-            time.sleep(5)
+                echo(colored(group['GroupName'], 'yellow', attrs=['bold']) + msg)
+            pause(5)
         else:
-            print(colored('No redundant groups were found in the account! Hurray!', color='green'))
+            echo(colored('No redundant groups were found in the account! Hurray!', color='green'))
 
-        print()
+        echo()
         unused_policies = unused['Policies']
         if len(unused_policies) > 0:
-            print(colored(f'The following {len(unused_policies)} policies are redundant:', 'yellow', attrs=['bold']))
+            echo(colored(f'The following {len(unused_policies)} policies are redundant:', 'yellow', attrs=['bold']))
             for policy in unused_policies:
-                print(colored(policy['PolicyName'], 'yellow', attrs=['bold']) + f' is not attached to any user, group or role')
-            time.sleep(5)
+                echo(colored(policy['PolicyName'], 'yellow', attrs=['bold']) + f' is not attached to any user, group or role')
+            pause(5)
         else:
-            print(colored('No unattached policies were found in the account! Hurray!', color='green'))
+            echo(colored('No unattached policies were found in the account! Hurray!', color='green'))
 
-        print()
+        echo()
         unused_policy_attachments = unused['PolicyAttachments']
         if len(unused_policy_attachments) > 0:
-            print(colored(f'The following {len(unused_policy_attachments)} policy attachments are unused:', 'yellow', attrs=['bold']))
+            echo(colored(f'The following {len(unused_policy_attachments)} policy attachments are unused:', 'yellow', attrs=['bold']))
             for policy_attachment in unused_policy_attachments:
                 principal = policy_attachment.get('Role') or policy_attachment.get('User') or policy_attachment.get('Group')
-                print(colored('Policy attached but not used: ', 'yellow', attrs=['bold']) + colored(principal, 'grey', attrs=['bold']) +
-                      f' is not using the privileges given by {colored(policy_attachment["PolicyArn"], "red", attrs=["bold"])}')
-            time.sleep(5)
+                echo(colored('Policy attached but not used: ', 'yellow', attrs=['bold']) + colored(principal, 'grey', attrs=['bold']) +
+                     f' is not using the privileges given by {colored(policy_attachment["PolicyArn"], "red", attrs=["bold"])}')
+            pause(5)
         else:
-            print(colored('No unused policy attachments were found in the account! Hurray!', color='green'))
+            echo(colored('No unused policy attachments were found in the account! Hurray!', color='green'))
 
-        print()
+        echo()
+
+    @staticmethod
+    def write_unused(runtime_results: RuntimeReport, output_format: OutputFormat, output) -> None:
+        """
+        Writes the unused entities in a machine readable format, one finding at a time, so the whole output is never held in memory
+        :param runtime_results: The report, either of a single account or a consolidated one
+        :param output_format:   One of json, jsonl or sarif
+        :param output:          A writable text stream, e.g. sys.stdout or an open file
+        """
+        writers = {
+            OutputFormat.json: Reporter._write_json,
+            OutputFormat.jsonl: Reporter._write_jsonl,
+            OutputFormat.sarif: Reporter._write_sarif
+        }
+        writers[output_format](runtime_results.get_unused(), output)
+
+    @staticmethod
+    def _iterate_findings(unused: dict):
+        for key, finding_type in FINDING_TYPES.items():
+            for finding in unused.get(key) or []:
+                yield finding_type, finding
+
+    @staticmethod
+    def _write_json(unused: dict, output) -> None:
+        output.write('{')
+        for i, key in enumerate(FINDING_TYPES):
+            output.write(f'{"," if i > 0 else ""}\n  {json.dumps(key)}: [')
+            for j, finding in enumerate(unused.get(key) or []):
+                output.write(f'{"," if j > 0 else ""}\n    {json.dumps(finding, sort_keys=True, default=str)}')
+            output.write('\n  ]')
+        output.write('\n}\n')
 
-        print('If you prefer to to change the current runtime and not move to IaC but the number of entities above is intimidating - consider using '
-              'our playbooks, available at: ')
-        print('https://www.bridgecrew.io/')
+    @staticmethod
+    def _write_jsonl(unused: dict, output) -> None:
+        for finding_type, finding in Reporter._iterate_findings(unused):
+            output.write(json.dumps({'FindingType': finding_type, **finding}, sort_keys=True, default=str) + '\n')
+
+    @staticmethod
+    def _write_sarif(unused: dict, output) -> None:
+        tool = {
+            'driver': {
+                'name': 'AirIAM',
+                'version': version,
+                'informationUri': 'https://github.com/bridgecrewio/AirIAM',
+                'rules': [{'id': rule_id, 'shortDescription': {'text': description}} for rule_id, description in SARIF_RULES.items()]
+            }
+        }
+        # The envelope is written key by key, so the results can be streamed into the run's results array
+        output.write(f'{{"$schema": {json.dumps(SARIF_SCHEMA)}, "version": "2.1.0", "runs": [{{"tool": {json.dumps(tool)}, "results": [')
+        for i, (finding_type, finding) in enumerate(Reporter._iterate_findings(unused)):
+            output.write(f'{"," if i > 0 else ""}\n{json.dumps(Reporter._to_sarif_result(finding_type, finding), default=str)}')
+        output.write('\n]}]}\n')
+
+    @staticmethod
+    def _to_sarif_result(finding_type: str, finding: dict) -> dict:
+        name, message = Reporter._describe_finding(finding_type, finding)
+        logical_location = {'name': name, 'kind': 'resource'}
+        if 'Arn' in finding:
+            logical_location['fullyQualifiedName'] = finding['Arn']
+        result = {
+            'ruleId': finding_type,
+            'level': 'warning',
+            'message': {'text': message},
+            'locations': [{'logicalLocations': [logical_location]}]
+        }
+        if 'AccountId' in finding:
+            result['properties'] = {'AccountId': finding['AccountId']}
+        return result
+
+    @staticmethod
+    def _describe_finding(finding_type: str, finding: dict) -> (str, str):
+        """
+        :return: The name of the entity the finding is about, and a plain text description of the finding
+        """
+        if finding_type == 'UnusedUser' or finding_type == 'UnusedRole':
+            name = finding.get('UserName') or finding.get('RoleName')
+            ending = 'Never used!' if finding['LastUsed'] == -1 else f'last used {finding["LastUsed"]} days ago'
+            return name, f'{name} is unused: {ending}'
+        if finding_type == 'UnusedActiveAccessKey':
+            return finding['User'], f'{finding["User"]} used access key #{finding["AccessKey"]} {finding["DaysSinceLastUse"]} days ago'
+        if finding_type == 'UnusedConsoleLoginProfile':
+            mfa = 'with MFA' if finding['MFAEnabled'] else 'WITHOUT MFA'
+            return finding['User'], f'{finding["User"]} has password access to the AWS console ({mfa}) but hasn\'t used it in the last ' \
+                                    f'{finding["DaysSinceLastUse"]} days'
+        if finding_type == 'RedundantGroup':
+            if len(finding['AttachedManagedPolicies'] + finding['GroupPolicyList']) == 0:
+                return finding['GroupName'], f'{finding["GroupName"]} has no policies attached to it'
+            return finding['GroupName'], f'{finding["GroupName"]} has no members'
+        if finding_type == 'UnattachedPolicy':
+            return finding['PolicyName'], f'{finding["PolicyName"]} is not attached to any user, group or role'
+        principal = finding.get('Role') or finding.get('User') or finding.get('Group')
+        return principal, f'{principal} is not using the privileges given by {finding["PolicyArn"]}'
 
     @staticmethod
     def print_prelude():
@@ -0,0 +1,4 @@
+import os
+
+# The maximal number of processes AirIAM runs in parallel, e.g. to scan several accounts at once or to generate Terraform code
+MAX_PROCESSES = int(os.getenv("MAX_PROCESSES", os.cpu_count() or 1))
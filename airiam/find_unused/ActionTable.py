@@ -0,0 +1,128 @@
+import bisect
+import fnmatch
+import functools
+import gzip
+import json
+import logging
+import os
+import pathlib
+import re
+
+ACTION_TABLE_URL = 'https://raw.githubusercontent.com/salesforce/policy_sentry/master/policy_sentry/shared/data/iam-definition.json'
+ACTION_TABLE_SCHEMA_VERSION = 1
+ACTION_TABLE_FILE_NAME = 'iam_actions.json.gz'
+BUNDLED_ACTION_TABLE = os.path.join(os.path.abspath(os.path.dirname(__file__)), 'data', ACTION_TABLE_FILE_NAME)
+
+
+def get_user_cache_dir() -> str:
+    return os.path.join(os.getenv('XDG_CACHE_HOME', os.path.join(os.path.expanduser('~'), '.cache')), 'airiam')
+
+
+class ActionTable:
+    """
+    Holds the access level of every IAM action, keyed by service prefix and privilege name.
+    The table ships with the package and is only deserialized the first time it is needed. A newer table can be
+    downloaded into the user cache dir with `airiam refresh_actions`, in which case it takes precedence.
+    """
+    _services = None
+    _index = {}
+
+    @staticmethod
+    def get_services() -> dict:
+        """
+        :return: A dict of the format {service_prefix: {privilege_name: access_level}}
+        """
+        if ActionTable._services is None:
+            ActionTable._services = ActionTable._load()
+        return ActionTable._services
+
+    @staticmethod
+    @functools.lru_cache(maxsize=None)
+    def get_access_levels(service: str, action_pattern: str) -> frozenset:
+        """
+        Resolves an action pattern of a single service to the access levels of all the privileges it matches.
+        IAM action names are case insensitive, and wildcards are resolved by a prefix lookup in the service's sorted privilege names,
+        so only the privileges sharing the pattern's literal prefix are ever compared against it
+        :param service:        The service prefix, e.g. s3
+        :param action_pattern: The action name, optionally containing wildcards, e.g. Get*
+        :return: The set of access levels of the matching privileges
+        """
+        privilege_names, access_levels = ActionTable._get_service_index(service.lower())
+        action_pattern = action_pattern.lower()
+        wildcard_position = min([i for i in [action_pattern.find('*'), action_pattern.find('?')] if i >= 0], default=-1)
+        if wildcard_position < 0:
+            i = bisect.bisect_left(privilege_names, action_pattern)
+            if i < len(privilege_names) and privilege_names[i] == action_pattern:
+                return frozenset([access_levels[i]])
+            return frozenset()
+
+        prefix = action_pattern[:wildcard_position]
+        start = bisect.bisect_left(privilege_names, prefix)
+        end = bisect.bisect_right(privilege_names, prefix + '\uffff', lo=start)
+        if action_pattern[wildcard_position:] == '*':
+            return frozenset(access_levels[start:end])
+        action_regex = re.compile(fnmatch.translate(action_pattern))
+        return frozenset(access_levels[i] for i in range(start, end) if action_regex.match(privilege_names[i]))
+
+    @staticmethod
+    def _get_service_index(service: str) -> (list, list):
+        if service not in ActionTable._index:
+            privileges = sorted((privilege.lower(), access_level)
+                                for privilege, access_level in ActionTable.get_services().get(service, {}).items())
+            ActionTable._index[service] = ([privilege for privilege, _ in privileges], [access_level for _, access_level in privileges])
+        return ActionTable._index[service]
+
+    @staticmethod
+    def _load() -> dict:
+        cached_table = os.path.join(get_user_cache_dir(), ACTION_TABLE_FILE_NAME)
+        for path in [cached_table, BUNDLED_ACTION_TABLE]:
+            if not os.path.exists(path):
+                continue
+            # noinspection PyBroadException
+            try:
+                with gzip.open(path, 'rt') as table_file:
+                    table = json.load(table_file)
+                if table['SchemaVersion'] == ACTION_TABLE_SCHEMA_VERSION:
+                    return table['Services']
+                logging.warning(f'Ignoring the actions table at {path} as it has an unsupported schema version')
+            except Exception as e:
+                logging.warning(f'Failed to read the actions table at {path}: {str(e)}')
+        raise FileNotFoundError('No valid IAM actions table was found, run `airiam refresh_actions` to download one')
+
+    @staticmethod
+    def compact(iam_definition: dict) -> dict:
+        """
+        Converts policy_sentry's IAM definition into the compact table format AirIAM stores on disk
+        :param iam_definition: The IAM definition as published by policy_sentry
+        :return: A dict of the format {"SchemaVersion": ..., "Services": {service_prefix: {privilege_name: access_level}}}
+        """
+        services = {}
+        for service_prefix, service_obj in iam_definition.items():
+            if not isinstance(service_obj, dict):
+                # Skips metadata entries such as policy_sentry_schema_version
+                continue
+            services[service_prefix] = {privilege: privilege_obj['access_level']
+                                        for privilege, privilege_obj in service_obj.get('privileges', {}).items()}
+        return {'SchemaVersion': ACTION_TABLE_SCHEMA_VERSION, 'Services': services}
+
+    @staticmethod
+    def write(table: dict, path: str) -> None:
+        pathlib.Path(os.path.dirname(path)).mkdir(parents=True, exist_ok=True)
+        with gzip.GzipFile(path, 'wb', mtime=0) as table_file:
+            table_file.write(json.dumps(table, sort_keys=True, separators=(',', ':')).encode('utf-8'))
+
+    @staticmethod
+    def refresh() -> str:
+        """
+        Downloads the latest IAM definition and stores its compact form in the user cache dir
+        :return: The path of the refreshed actions table
+        """
+        import requests
+
+        table = ActionTable.compact(requests.get(ACTION_TABLE_URL).json())
+        path = os.path.join(get_user_cache_dir(), ACTION_TABLE_FILE_NAME)
+        ActionTable.write(table, path)
+        ActionTable._services = table['Services']
+        ActionTable._index = {}
+        ActionTable.get_access_levels.cache_clear()
+        return path
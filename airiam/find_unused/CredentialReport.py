@@ -0,0 +1,68 @@
+import csv
+import datetime as dt
+import io
+
+NOT_AVAILABLE = 'N/A'
+DATE_COLUMNS = frozenset([
+    'user_creation_time',
+    'password_last_used',
+    'password_last_changed',
+    'password_next_rotation',
+    'access_key_1_last_rotated',
+    'access_key_1_last_used_date',
+    'access_key_2_last_rotated',
+    'access_key_2_last_used_date',
+    'cert_1_last_rotated',
+    'cert_2_last_rotated'
+])
+
+
+class CredentialReport:
+    """
+    Parses AWS IAM credential reports into compact per-user records: columns with no value (N/A) are dropped, and dates are converted to
+    epoch seconds. Values which aren't dates, such as no_information or not_supported, are kept as is
+    """
+
+    @staticmethod
+    def read(csv_content: bytes) -> dict:
+        """
+        Streams the rows of the credential report CSV straight into records, without splitting the whole report up front
+        :param csv_content: The credential report's Content, as returned by get_credential_report
+        :return: A dict of the format {user_name: record}
+        """
+        reader = csv.DictReader(io.TextIOWrapper(io.BytesIO(csv_content), encoding='utf-8', newline=''))
+        return CredentialReport.by_user(reader)
+
+    @staticmethod
+    def by_user(credential_report) -> dict:
+        """
+        :param credential_report: Either a dict of records keyed by user name, or an iterable of rows, e.g. a credential report as it was
+                                  cached by older versions of AirIAM
+        :return: A dict of the format {user_name: record}
+        """
+        if isinstance(credential_report, dict):
+            return credential_report
+        records = {}
+        for row in credential_report:
+            record = CredentialReport.compact(row)
+            if 'user' in record:
+                records[record['user']] = record
+        return records
+
+    @staticmethod
+    def compact(row: dict) -> dict:
+        record = {}
+        for column, value in row.items():
+            if column is None or value is None or value == NOT_AVAILABLE or value == '':
+                continue
+            if column in DATE_COLUMNS and isinstance(value, str):
+                value = CredentialReport.to_epoch(value)
+            record[column] = value
+        return record
+
+    @staticmethod
+    def to_epoch(value: str):
+        try:
+            return int(dt.datetime.fromisoformat(value).timestamp())
+        except ValueError:
+            return value
@@ -0,0 +1,39 @@
+import datetime as dt
+from array import array
+
+SECONDS_PER_DAY = 24 * 60 * 60
+# Marks a missing date, e.g. an access key which was never used, in arrays of epoch times
+NO_DATE = -1
+
+
+class Dates:
+    """
+    The analysis works on dates as integer epoch seconds, parsed once, and measures how long ago they were against a single reference time,
+    so all the dates of a run are measured against the same "now"
+    """
+
+    @staticmethod
+    def to_epoch(date) -> int:
+        """
+        :param date: An ISO formatted date, epoch seconds, or one of the placeholders AWS uses for missing dates, e.g. N/A or no_information
+        :return: The date in epoch seconds, or NO_DATE if it is missing
+        """
+        if isinstance(date, int):
+            return date
+        try:
+            return int(dt.datetime.fromisoformat(date).timestamp())
+        except (TypeError, ValueError):
+            return NO_DATE
+
+    @staticmethod
+    def to_epochs(dates) -> array:
+        return array('q', (Dates.to_epoch(date) for date in dates))
+
+    @staticmethod
+    def days_since(epochs, now: int) -> array:
+        """
+        :param epochs: Epoch times, where NO_DATE marks a missing date
+        :param now:    The reference time, in epoch seconds
+        :return: The number of whole days passed since each of the epochs, or -1 for missing dates
+        """
+        return array('q', [(now - epoch) // SECONDS_PER_DAY if epoch != NO_DATE else -1 for epoch in epochs])
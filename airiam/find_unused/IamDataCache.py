@@ -0,0 +1,245 @@
+import copy
+import gzip
+import hashlib
+import json
+import logging
+import os
+import pathlib
+import tempfile
+import threading
+import time
+
+from airiam.find_unused.ManagedPolicyCatalog import ManagedPolicyCatalog, is_aws_managed_policy
+from airiam.version import version
+
+IAM_DATA_FILE_NAME = "iam_data.json.gz"
+MANIFEST_FILE_NAME = "manifest.json"
+CACHE_SCHEMA_VERSION = 3
+POLICY_DOCUMENT_KEYS = frozenset(['AssumeRolePolicyDocument', 'Document', 'PolicyDocument'])
+POLICY_DOCUMENT_REFERENCE = '$PolicyDocument'
+MANAGED_POLICY_DOCUMENT_HASH = 'ManagedPolicyDocumentHash'
+
+
+def get_cache_dir(account_id: str):
+    parent = f"./aircache/{account_id}"
+    pathlib.Path(parent).mkdir(parents=True, exist_ok=True)
+    return parent
+
+
+def get_iam_data_file(account_id: str):
+    return f"{get_cache_dir(account_id)}/{IAM_DATA_FILE_NAME}"
+
+
+def get_manifest_file(account_id: str):
+    return f"{get_cache_dir(account_id)}/{MANIFEST_FILE_NAME}"
+
+
+class IamDataCache:
+    """
+    The local cache of an account's IAM data. Next to the data itself, the cache holds a small manifest which describes the data - the
+    schema version, the account, the profile and AirIAM version used, and when each section of the data was collected - so the cache can
+    be validated without parsing the data.
+    The data is stored as compact gzipped JSON, in which every distinct policy document is stored once and referenced by its content hash.
+    The documents of AWS managed policies are stored in the ManagedPolicyCatalog shared by all accounts, so the account's data only
+    references them
+    """
+
+    # The background writes which are still in progress, keyed by account id
+    _pending_writes = {}
+
+    def __init__(self, account_id: str, profile=None, managed_policy_catalog=None):
+        self.account_id = account_id
+        self.profile = profile
+        self.managed_policy_catalog = managed_policy_catalog or ManagedPolicyCatalog()
+
+    def get_manifest(self):
+        """
+        :return: The cache's manifest, or None if there is no valid manifest
+        """
+        self.wait()
+        # noinspection PyBroadException
+        try:
+            with open(get_manifest_file(self.account_id)) as manifest_file:
+                manifest = json.load(manifest_file)
+        except Exception:
+            return None
+        if manifest.get('SchemaVersion') != CACHE_SCHEMA_VERSION or manifest.get('AccountId') != self.account_id:
+            return None
+        return manifest
+
+    def is_usable(self, max_age=None) -> bool:
+        """
+        :param max_age: The maximal age, in seconds, of the oldest section of the data. None means any age is acceptable
+        :return: True if the cache holds data of this account, in the current schema, which is younger than max_age and whose AWS managed
+                 policies are all in the catalog
+        """
+        manifest = self.get_manifest()
+        if manifest is None:
+            return False
+        if not all(self.managed_policy_catalog.has_document(document_hash) for document_hash in manifest.get('ManagedPolicyDocuments', [])):
+            print("Some of the AWS managed policies of the local data are missing from the managed policy catalog")
+            return False
+        if max_age is not None:
+            collected_at = min(manifest['Sections'].values(), default=0)
+            if time.time() - collected_at > max_age:
+                print(f"The local data was collected {int((time.time() - collected_at) / 3600)} hours ago, which exceeds the maximal cache age")
+                return False
+        return True
+
+    def load(self) -> dict:
+        self.wait()
+        with gzip.open(get_iam_data_file(self.account_id), 'rt', encoding='utf-8') as iam_data_file:
+            cached_data = json.load(iam_data_file)
+        iam_data = IamDataCache._restore_policy_documents(cached_data['IamData'], cached_data['PolicyDocuments'])
+        for policy in iam_data.get('AccountPolicies', []):
+            for policy_version in policy.get('PolicyVersionList', []):
+                if MANAGED_POLICY_DOCUMENT_HASH in policy_version:
+                    policy_version['Document'] = self.managed_policy_catalog.get_document(policy_version.pop(MANAGED_POLICY_DOCUMENT_HASH))
+        return iam_data
+
+    def save(self, iam_data: dict) -> None:
+        """
+        Writes the data and then its manifest, so a manifest only exists for data which was completely written
+        """
+        self.wait()
+        cached_data = self._pack(iam_data)
+        self._write(cached_data, self._create_manifest(iam_data, cached_data))
+
+    def save_in_background(self, iam_data: dict) -> threading.Thread:
+        """
+        Packs and writes the data on a background thread, so the analysis can start as soon as the data is collected. The thread is handed a
+        snapshot of the data, so the caller is free to modify it, and reading this account's cache waits for the write to complete
+        :return: The thread writing the data
+        """
+        self.wait()
+        writer = threading.Thread(target=self._write_in_background, args=(copy.deepcopy(iam_data), int(time.time())),
+                                  name=f'iam-data-cache-{self.account_id}')
+        IamDataCache._pending_writes[self.account_id] = writer
+        writer.start()
+        return writer
+
+    @staticmethod
+    def wait_for_pending_writes() -> None:
+        for writer in list(IamDataCache._pending_writes.values()):
+            writer.join()
+        IamDataCache._pending_writes.clear()
+
+    def wait(self) -> None:
+        writer = IamDataCache._pending_writes.pop(self.account_id, None)
+        if writer is not None:
+            writer.join()
+
+    def _write_in_background(self, iam_data: dict, collected_at: int) -> None:
+        # noinspection PyBroadException
+        try:
+            cached_data = self._pack(iam_data)
+            self._write(cached_data, self._create_manifest(iam_data, cached_data, collected_at))
+        except Exception as e:
+            logging.warning(f'Failed to write the local IAM data of account {self.account_id}: {str(e)}')
+
+    def _write(self, cached_data: dict, manifest: dict) -> None:
+        """
+        Both files are written to temporary files which then replace the previous ones. The previous manifest is removed before the data is
+        replaced, so an interrupted write leaves no manifest, and the cache is collected again
+        """
+        manifest_file_path = get_manifest_file(self.account_id)
+        if os.path.exists(manifest_file_path):
+            os.remove(manifest_file_path)
+
+        def write_iam_data(path):
+            with gzip.open(path, 'wt', encoding='utf-8', compresslevel=6) as iam_file:
+                json.dump(cached_data, iam_file, separators=(',', ':'), sort_keys=True, default=str)
+
+        def write_manifest(path):
+            with open(path, 'w') as manifest_file:
+                json.dump(manifest, manifest_file, indent=4, sort_keys=True)
+
+        IamDataCache._replace(get_iam_data_file(self.account_id), write_iam_data)
+        IamDataCache._replace(manifest_file_path, write_manifest)
+
+    @staticmethod
+    def _replace(path: str, write) -> None:
+        """
+        Writes to a temporary file which then replaces the target, so the target is either the previous file or the completely written one
+        :param write: A function which writes the file at the path it is given
+        """
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        os.close(fd)
+        try:
+            write(temp_path)
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+    def _pack(self, iam_data: dict) -> dict:
+        if 'AccountPolicies' in iam_data:
+            iam_data = {**iam_data, 'AccountPolicies': [self._reference_managed_policy_documents(policy) for policy in iam_data['AccountPolicies']]}
+        policy_documents = {}
+        return {
+            'IamData': IamDataCache._deduplicate_policy_documents(iam_data, policy_documents),
+            'PolicyDocuments': policy_documents
+        }
+
+    def _reference_managed_policy_documents(self, policy: dict) -> dict:
+        """
+        :return: A copy of an AWS managed policy, in which the document of every version is replaced by its hash in the managed policy catalog
+        """
+        if not is_aws_managed_policy(policy['Arn']):
+            return policy
+        policy_versions = []
+        for policy_version in policy.get('PolicyVersionList', []):
+            policy_version = dict(policy_version)
+            policy_version[MANAGED_POLICY_DOCUMENT_HASH] = self.managed_policy_catalog.put_document(policy_version.pop('Document'))
+            policy_versions.append(policy_version)
+        return {**policy, 'PolicyVersionList': policy_versions}
+
+    def _create_manifest(self, iam_data: dict, cached_data: dict, collected_at=None) -> dict:
+        collected_at = collected_at if collected_at is not None else int(time.time())
+        sections = {section: collected_at for section in iam_data}
+        last_accessed_times = [principal['LastAccessedTime'] for principal in iam_data.get('AccountUsers', []) + iam_data.get('AccountRoles', [])
+                               if 'LastAccessedTime' in principal]
+        if len(last_accessed_times) > 0:
+            # Usage reports may be reused by incremental refreshes, so their section is as old as the oldest report
+            sections['LastAccessed'] = min(last_accessed_times)
+        return {
+            'SchemaVersion': CACHE_SCHEMA_VERSION,
+            'AccountId': self.account_id,
+            'Profile': self.profile,
+            'ToolVersion': version,
+            'Sections': sections,
+            'ManagedPolicyDocuments': sorted({policy_version[MANAGED_POLICY_DOCUMENT_HASH]
+                                              for policy in cached_data['IamData'].get('AccountPolicies', [])
+                                              for policy_version in policy.get('PolicyVersionList', [])
+                                              if MANAGED_POLICY_DOCUMENT_HASH in policy_version})
+        }
+
+    @staticmethod
+    def _deduplicate_policy_documents(obj, policy_documents: dict):
+        """
+        :return: A copy of obj in which every policy document is replaced by a reference to its content hash in policy_documents
+        """
+        if isinstance(obj, dict):
+            result = {}
+            for key, value in obj.items():
+                if key in POLICY_DOCUMENT_KEYS and isinstance(value, dict):
+                    serialized_document = json.dumps(value, separators=(',', ':'), sort_keys=True, default=str)
+                    document_hash = hashlib.sha256(serialized_document.encode('utf-8')).hexdigest()
+                    policy_documents.setdefault(document_hash, value)
+                    result[key] = {POLICY_DOCUMENT_REFERENCE: document_hash}
+                else:
+                    result[key] = IamDataCache._deduplicate_policy_documents(value, policy_documents)
+            return result
+        if isinstance(obj, list):
+            return [IamDataCache._deduplicate_policy_documents(item, policy_documents) for item in obj]
+        return obj
+
+    @staticmethod
+    def _restore_policy_documents(obj, policy_documents: dict):
+        if isinstance(obj, dict):
+            if len(obj) == 1 and POLICY_DOCUMENT_REFERENCE in obj:
+                return policy_documents[obj[POLICY_DOCUMENT_REFERENCE]]
+            return {key: IamDataCache._restore_policy_documents(value, policy_documents) for key, value in obj.items()}
+        if isinstance(obj, list):
+            return [IamDataCache._restore_policy_documents(item, policy_documents) for item in obj]
+        return obj
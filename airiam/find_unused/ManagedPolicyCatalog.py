@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+import pathlib
+import tempfile
+
+from airiam.find_unused.ActionTable import get_user_cache_dir
+
+AWS_MANAGED_POLICY_ARN_PREFIX = ':iam::aws:policy/'
+CATALOG_DIR_NAME = 'managed_policies'
+
+
+def is_aws_managed_policy(policy_arn: str) -> bool:
+    return AWS_MANAGED_POLICY_ARN_PREFIX in policy_arn
+
+
+class ManagedPolicyCatalog:
+    """
+    An on-disk catalog of AWS managed policy versions, shared by all the accounts scanned on this machine. AWS managed policy versions never
+    change once they are published, so each version is only fetched once, and the per-account caches only reference it.
+    Documents are stored by their content hash, and each policy version is a small record which points to its document:
+        <catalog_dir>/documents/<document_hash>.json
+        <catalog_dir>/versions/<policy_id>/<version_id>.json
+    """
+
+    def __init__(self, catalog_dir=None):
+        self.catalog_dir = catalog_dir or os.path.join(get_user_cache_dir(), CATALOG_DIR_NAME)
+
+    def get_version(self, policy_id: str, version_id: str):
+        """
+        :return: The record of the policy version, of the format {Arn, Description, VersionId, CreateDate, DocumentHash}, or None if the
+                 version isn't in the catalog
+        """
+        record = self._read(self._get_version_path(policy_id, version_id))
+        if record is None or not self.has_document(record['DocumentHash']):
+            return None
+        return record
+
+    def put_version(self, policy_id: str, policy_arn: str, description: str, policy_version: dict) -> dict:
+        """
+        :param policy_id:      The ID of the AWS managed policy
+        :param policy_arn:     The ARN of the AWS managed policy
+        :param description:    The policy's description
+        :param policy_version: The policy version, as returned by get_policy_version
+        :return: The record of the policy version
+        """
+        record = {
+            'Arn': policy_arn,
+            'Description': description,
+            'VersionId': policy_version['VersionId'],
+            'CreateDate': str(policy_version['CreateDate']),
+            'DocumentHash': self.put_document(policy_version['Document'])
+        }
+        self._write(self._get_version_path(policy_id, policy_version['VersionId']), record)
+        return record
+
+    def get_document(self, document_hash: str) -> dict:
+        document = self._read(self._get_document_path(document_hash))
+        if document is None:
+            raise FileNotFoundError(f'The policy document {document_hash} is missing from the managed policy catalog at {self.catalog_dir}')
+        return document
+
+    def has_document(self, document_hash: str) -> bool:
+        return os.path.exists(self._get_document_path(document_hash))
+
+    def put_document(self, document: dict) -> str:
+        """
+        :return: The content hash of the document, by which it is stored
+        """
+        serialized_document = json.dumps(document, separators=(',', ':'), sort_keys=True, default=str)
+        document_hash = hashlib.sha256(serialized_document.encode('utf-8')).hexdigest()
+        if not self.has_document(document_hash):
+            self._write(self._get_document_path(document_hash), document)
+        return document_hash
+
+    def _get_document_path(self, document_hash: str) -> str:
+        return os.path.join(self.catalog_dir, 'documents', f'{document_hash}.json')
+
+    def _get_version_path(self, policy_id: str, version_id: str) -> str:
+        return os.path.join(self.catalog_dir, 'versions', policy_id, f'{version_id}.json')
+
+    @staticmethod
+    def _read(path: str):
+        # noinspection PyBroadException
+        try:
+            with open(path) as catalog_file:
+                return json.load(catalog_file)
+        except Exception:
+            return None
+
+    @staticmethod
+    def _write(path: str, obj: dict) -> None:
+        """
+        Writes to a temporary file which then replaces the target, so concurrent scans never read a partially written file
+        """
+        directory = os.path.dirname(path)
+        pathlib.Path(directory).mkdir(parents=True, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as catalog_file:
+                json.dump(obj, catalog_file, separators=(',', ':'), sort_keys=True, default=str)
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
@@ -1,12 +1,11 @@
 import json
 import logging
 import re
-import requests
 
-ACTION_TABLE_URL = 'https://raw.githubusercontent.com/salesforce/policy_sentry/master/policy_sentry/shared/data/iam-definition.json'
-ACTIONS_NOT_COVERED_BY_ACCESS_ADVISOR = ['iam:PassRole', 's3:GetObject', 's3:PutObject']
+from airiam.find_unused.ActionTable import ActionTable
 
-action_map = requests.get(ACTION_TABLE_URL).json()
+ACTIONS_NOT_COVERED_BY_ACCESS_ADVISOR = ['iam:PassRole', 's3:GetObject', 's3:PutObject']
+WRITE_ACCESS_LEVELS = frozenset(['Write', 'Delete', 'Permissions management'])
 
 
 class PolicyAnalyzer:
@@ -32,22 +31,7 @@ class PolicyAnalyzer:
 
     @staticmethod
     def is_policy_unused(policy_document: dict, services_last_accessed: list) -> bool:
-        statements_str = json.dumps(policy_document['Statement'])
-        if '"Effect": "Deny"' in statements_str or '"NotAction":' in statements_str:
-            # If statement contains a "Deny" effect - Access Advisor won't detect that action because it is a restriction
-            # If statement contains a "NotAction" effect - Access Advisor won't detect usage of this policy correctly
-            return False
-
-        policy_actions = PolicyAnalyzer._get_policy_actions(policy_document)
-        if len([action for action in policy_actions if
-                len(list(filter(re.compile(action.replace('*', '.*')).match, ACTIONS_NOT_COVERED_BY_ACCESS_ADVISOR))) > 0]) > 0:
-            return False
-
-        services_accessed_through_policy = list(set(map(lambda action: action.split(':')[0], policy_actions)))
-        return len(
-            [service for service in services_accessed_through_policy if
-             len(list(filter(re.compile(service.replace('*', '.*')).match, services_last_accessed))) > 0
-             ]) == 0
+        return PolicyAnalysis(policy_document).is_unused(services_last_accessed)
 
     @staticmethod
     def policy_is_write_access(policy_document):
@@ -56,18 +40,58 @@ class PolicyAnalyzer:
             if action == '*' or '*' in action.split(':'):
                 return True
             [action_service, action_name] = action.split(':')
-            try:
-                action_regex = action_name.replace('*', '.*')
-                action_objs = []
-                for priv, priv_obj in action_map.get(action_service, {}).get('privileges', []).items():
-                    if re.match(action_regex, priv):
-                        action_objs.append(priv_obj)
-            except StopIteration:
-                action_objs = []
-                logging.warning(f'The action {action} is not in the actions map!')
-                logging.debug(f'action_map = {action_map}')
-
-            for action_obj in action_objs:
-                if action_obj['access_level'] in ['Write', 'Delete', 'Permissions management']:
-                    return True
+            access_levels = ActionTable.get_access_levels(action_service, action_name)
+            if len(access_levels) == 0:
+                logging.debug(f'The action {action} is not in the actions map!')
+            if len(access_levels & WRITE_ACCESS_LEVELS) > 0:
+                return True
         return False
+
+
+class PolicyAnalysis:
+    """
+    The result of parsing a single policy document, which doesn't depend on the principal the policy is attached to
+    """
+
+    def __init__(self, policy_document: dict):
+        self._policy_document = policy_document
+        statements = PolicyAnalyzer.convert_to_list(policy_document['Statement'])
+        # If statement contains a "Deny" effect - Access Advisor won't detect that action because it is a restriction
+        # If statement contains a "NotAction" effect - Access Advisor won't detect usage of this policy correctly
+        self.has_deny_or_not_action = any(statement.get('Effect') == 'Deny' or 'NotAction' in statement for statement in statements)
+        self.actions = frozenset(PolicyAnalyzer._get_policy_actions(policy_document))
+        self.services = frozenset(action.split(':')[0] for action in self.actions)
+        self.covers_actions_not_in_access_advisor = any(
+            any(map(re.compile(action.replace('*', '.*')).match, ACTIONS_NOT_COVERED_BY_ACCESS_ADVISOR)) for action in self.actions)
+        self._service_regexes = [re.compile(service.replace('*', '.*')) for service in self.services]
+        self._is_write_access = None
+
+    def is_unused(self, services_last_accessed: list) -> bool:
+        if self.has_deny_or_not_action or self.covers_actions_not_in_access_advisor:
+            return False
+        return not any(service_regex.match(service) for service_regex in self._service_regexes for service in services_last_accessed)
+
+    def is_write_access(self) -> bool:
+        if self._is_write_access is None:
+            self._is_write_access = PolicyAnalyzer.policy_is_write_access(self._policy_document)
+        return self._is_write_access
+
+
+class PolicyAnalysisCache:
+    """
+    Holds the analysis of every managed policy seen during a run, so a policy attached to many principals is parsed only once
+    """
+
+    def __init__(self):
+        self._analyses = {}
+
+    def get_analysis(self, policy_obj: dict) -> PolicyAnalysis:
+        """
+        :param policy_obj: A managed policy as returned by get_account_authorization_details
+        :return: The analysis of the policy's default version
+        """
+        key = (policy_obj['Arn'], policy_obj['DefaultVersionId'])
+        if key not in self._analyses:
+            policy_document = next(version for version in policy_obj['PolicyVersionList'] if version['IsDefaultVersion'])['Document']
+            self._analyses[key] = PolicyAnalysis(policy_document)
+        return self._analyses[key]
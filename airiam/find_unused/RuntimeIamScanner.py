@@ -1,26 +1,41 @@
+import asyncio
 import concurrent.futures
+import csv
+import datetime
+import functools
+import hashlib
+import io
 import json
 import logging
 import os
-import pathlib
 import time
 
 import boto3
 from botocore.config import Config
 from botocore.exceptions import ClientError
 
+from airiam.find_unused.CredentialReport import CredentialReport
+from airiam.find_unused.IamDataCache import IamDataCache
+from airiam.find_unused.ManagedPolicyCatalog import ManagedPolicyCatalog
 from airiam.models.RuntimeReport import RuntimeReport
 
-config = Config(retries={'max_attempts': 10, 'mode': 'standard'})
-IAM_DATA_FILE_NAME = "iam_data.json"
+# The adaptive retry mode rate-limits the client whenever AWS responds with a throttling error, which keeps the concurrent workers below the
+# account's IAM API quota
+config = Config(retries={'max_attempts': 10, 'mode': 'adaptive'})
+MAX_WORKERS = int(os.getenv("MAX_WORKERS", 5))
+LAST_ACCESSED_DEADLINE = int(os.getenv("LAST_ACCESSED_DEADLINE", 600))
+CREDENTIAL_REPORT_MAX_AGE = int(os.getenv("CREDENTIAL_REPORT_MAX_AGE", 4 * 60 * 60))
+CREDENTIAL_REPORT_DEADLINE = int(os.getenv("CREDENTIAL_REPORT_DEADLINE", 300))
+MIN_POLL_INTERVAL = 1
+MAX_POLL_INTERVAL = 16
 ERASE_LINE = '\x1b[2K'
-
-
-def get_iam_data_file(account_id: str):
-    parent = f"./aircache/{account_id}"
-    pathlib.Path(parent).mkdir(parents=True, exist_ok=True)
-    p = f"{parent}/{IAM_DATA_FILE_NAME}"
-    return p
+COLLECTION_BACKENDS = ['sync', 'asyncio']
+# The maximal number of collection stages the asyncio backend runs at the same time
+COLLECTION_STAGES = 6
+# When refreshing the cache incrementally, the usage reports of principals whose policies didn't change are reused for this many seconds
+LAST_ACCESSED_TTL = int(os.getenv("LAST_ACCESSED_TTL", 24 * 60 * 60))
+# The fields of a principal which determine the privileges it has, and are hashed to detect changes between incremental refreshes
+PRINCIPAL_POLICY_FIELDS = ['AttachedManagedPolicies', 'GroupList', 'PermissionsBoundary', 'RolePolicyList', 'UserPolicyList']
 
 
 class RuntimeIamScanner:
@@ -29,13 +44,22 @@ class RuntimeIamScanner:
     It's entry point is the method `evaluate_runtime_iam`
     """
 
-    def __init__(self, logger, profile=None, refresh_cache=False):
+    def __init__(self, logger, profile=None, refresh_cache=False, collection_backend='sync', incremental=False, max_cache_age=None,
+                 role_arn=None, managed_policy_catalog=None):
         self.logger = logger
+        self.profile = profile
+        self.max_cache_age = max_cache_age
         self.refresh_cache = refresh_cache
+        self.collection_backend = collection_backend
+        self.incremental = incremental
+        self._previous_principals = {}
+        self.managed_policy_catalog = managed_policy_catalog or ManagedPolicyCatalog()
         if profile:
             self._session = boto3.Session(profile_name=profile)
         else:
             self._session = boto3.Session()
+        if role_arn:
+            self._session = RuntimeIamScanner._assume_role(self._session, role_arn)
 
     def evaluate_runtime_iam(self, list_unused: bool, command: str) -> RuntimeReport:
         """
@@ -59,78 +83,136 @@ class RuntimeIamScanner:
     def _get_data_from_aws(self, account_id: str, list_unused: bool) -> dict:
         """
         This method encapsulates all the API calls made to the AWS IAM service to gather data for later analysis
-        :return: The IAM data that was pulled from the account, as was also saved locally for quicker re-runs
+        :return: The IAM data that was pulled from the account, as is also saved locally for quicker re-runs
         """
 
-        data_account_id = RuntimeIamScanner._get_account_id_from_existing_data(
-            account_id
-        )
-
-        iam_file_name = get_iam_data_file(account_id)
-        logging.debug("IAM FILE NAME", iam_file_name)
-        logging.debug("Data account  id", data_account_id)
-
-        if not self.refresh_cache and data_account_id == account_id:
-            print("Reusing local data")
+        cache = IamDataCache(account_id, self.profile, self.managed_policy_catalog)
+        if not self.refresh_cache and not self.incremental and cache.is_usable(self.max_cache_age):
+            iam_data = self._load_cache(cache)
+            if iam_data is not None:
+                print("Reusing local data")
+                return iam_data
+        if self.incremental and cache.is_usable():
+            previous_iam_data = self._load_cache(cache)
+            if previous_iam_data is not None:
+                print(f"Incrementally refreshing the local IAM data of account {account_id}")
+                self._previous_principals = {principal['Arn']: principal
+                                             for principal in previous_iam_data['AccountUsers'] + previous_iam_data['AccountRoles']}
+        print(f"Getting all IAM configurations for account {account_id}")
+        iam = self._session.client('iam', config=config)
+        if self.collection_backend == 'asyncio':
+            iam_data = asyncio.run(self._collect_iam_data_async(iam, list_unused))
         else:
-            print(f"Getting all IAM configurations for account {account_id}")
-            iam = self._session.client('iam', config=config)
-            iam.generate_credential_report()
-            account_users, account_roles, account_groups, account_policies = RuntimeIamScanner.get_account_iam_configuration(
-                iam)
-            print("Getting IAM credential report")
-            csv_credential_report = iam.get_credential_report()[
-                'Content'].decode('utf-8')
-            credential_report = RuntimeIamScanner.convert_csv_to_json(
-                csv_credential_report)
-
-            if list_unused:
-                account_principals = account_users + account_roles
-                entity_arn_list = list(
-                    map(lambda e: e['Arn'], account_principals))
-                last_accessed_map = self._generate_last_access(
-                    iam, entity_arn_list)
-
-                for arn, last_accessed_list in last_accessed_map.items():
-                    entity = next(
-                        entity for entity in account_principals if entity['Arn'] == arn)
-                    entity['LastAccessed'] = last_accessed_list
-
-            print("Collecting password configurations for all IAM users in the account")
-            for user in account_users:
-                try:
-                    iam.get_login_profile(UserName=user['UserName'])
-                    user['LoginProfileExists'] = True
-                except ClientError as exception:
-                    if exception.response['Error']['Code'] == 'NoSuchEntity':
-                        user['LoginProfileExists'] = False
-                    else:
-                        raise exception
-
-            print("Completed data collection, writing to local file...")
-            iam_data = {
-                'CredentialReport': credential_report,
-                'AccountUsers': account_users,
-                'AccountRoles': account_roles,
-                'AccountGroups': account_groups,
-                'AccountPolicies': account_policies
-            }
-            with open(get_iam_data_file(account_id=account_id), "w") as iam_file:
-                json.dump(iam_data, iam_file, indent=4,
-                          sort_keys=True, default=str)
-        with open(get_iam_data_file(account_id=account_id)) as iam_data_file:
-            iam_data = json.load(iam_data_file)
+            iam_data = self._collect_iam_data(iam, list_unused)
 
+        RuntimeIamScanner._normalize(iam_data)
+        print("Completed data collection, writing to local file in the background")
+        cache.save_in_background(iam_data)
         return iam_data
 
+    def _load_cache(self, cache: IamDataCache):
+        """
+        :return: The cached data, or None if it can't be read, in which case the data is collected again
+        """
+        # noinspection PyBroadException
+        try:
+            return cache.load()
+        except Exception as e:
+            self.logger.warning(f'Failed to read the local IAM data of account {cache.account_id}, collecting it again: {str(e)}')
+            return None
+
+    @staticmethod
+    def _normalize(obj):
+        """
+        Converts the values JSON can't represent, such as the datetimes returned by boto3, to strings in place - just as they are
+        serialized to the local cache - so the collected data is interchangeable with the cached data
+        """
+        for key, value in (obj.items() if isinstance(obj, dict) else enumerate(obj)):
+            if isinstance(value, (dict, list)):
+                RuntimeIamScanner._normalize(value)
+            elif value is not None and not isinstance(value, (str, int, float)):
+                obj[key] = str(value)
+        return obj
+
     def _get_aws_iam_client(self):
         """
         Create an AWS IAM client with the profile that was supplies or default credentials if none was supplied
         :return: AWS IAM client
         """
 
+    def _collect_iam_data(self, iam, list_unused: bool) -> dict:
+        """
+        Collects the IAM data by running the collection stages one after the other
+        """
+        credential_report = RuntimeIamScanner._start_credential_report_generation(iam)
+        account_users, account_roles, account_groups, account_policies = RuntimeIamScanner.get_account_iam_configuration(
+            iam, self.managed_policy_catalog)
+        print("Getting IAM credential report")
+        if credential_report is None:
+            credential_report = RuntimeIamScanner._get_credential_report(iam)
+
+        if list_unused:
+            self._add_last_accessed(iam, account_users + account_roles)
+
+        print("Collecting password configurations for all IAM users in the account")
+        RuntimeIamScanner._add_login_profiles(iam, account_users, credential_report)
+
+        return {
+            'CredentialReport': credential_report,
+            'AccountUsers': account_users,
+            'AccountRoles': account_roles,
+            'AccountGroups': account_groups,
+            'AccountPolicies': account_policies
+        }
+
+    async def _collect_iam_data_async(self, iam, list_unused: bool) -> dict:
+        """
+        Collects the IAM data by overlapping the collection stages: the credential report is acquired, and the roles' descriptions and AWS
+        managed policies are listed while the authorization details are paginated, and the policy descriptions, access advisor jobs and
+        login profiles are then collected together. The boto3 calls are bridged to the event loop through a thread pool, as the client itself is synchronous
+        """
+        loop = asyncio.get_running_loop()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=COLLECTION_STAGES) as executor:
+            def run_stage(func, *args):
+                return loop.run_in_executor(executor, functools.partial(func, *args))
+
+            credential_report_acquisition = run_stage(RuntimeIamScanner._acquire_credential_report, iam)
+            role_descriptions = run_stage(RuntimeIamScanner._list_role_descriptions, iam)
+            aws_managed_policies = run_stage(RuntimeIamScanner._get_aws_managed_policies, iam, self.managed_policy_catalog)
+            account_users, account_roles, account_groups, account_policies = RuntimeIamScanner._filter_account_entities(
+                *await run_stage(RuntimeIamScanner._get_authorization_details, iam))
+
+            stages = [run_stage(RuntimeIamScanner._add_policy_descriptions, iam, account_policies)]
+            if list_unused:
+                stages.append(run_stage(self._add_last_accessed, iam, account_users + account_roles))
+            credential_report = await credential_report_acquisition
+            stages.append(run_stage(RuntimeIamScanner._add_login_profiles, iam, account_users, credential_report))
+            RuntimeIamScanner._add_role_descriptions(account_roles, await role_descriptions)
+            await asyncio.gather(*stages)
+            account_policies += await aws_managed_policies
+
+        return {
+            'CredentialReport': credential_report,
+            'AccountUsers': account_users,
+            'AccountRoles': account_roles,
+            'AccountGroups': account_groups,
+            'AccountPolicies': account_policies
+        }
+
+    @staticmethod
+    def get_account_iam_configuration(iam, managed_policy_catalog=None):
+        account_users, account_roles, account_groups, account_policies = RuntimeIamScanner._filter_account_entities(
+            *RuntimeIamScanner._get_authorization_details(iam))
+        RuntimeIamScanner._add_policy_descriptions(iam, account_policies)
+        RuntimeIamScanner._add_role_descriptions(account_roles, RuntimeIamScanner._list_role_descriptions(iam))
+        account_policies += RuntimeIamScanner._get_aws_managed_policies(iam, managed_policy_catalog or ManagedPolicyCatalog())
+        return account_users, account_roles, account_groups, account_policies
+
     @staticmethod
-    def get_account_iam_configuration(iam):
+    def _get_authorization_details(iam) -> (list, list, list, list):
+        """
+        AWS managed policies are excluded, as their versions are the same in every account and are fetched through the managed policy catalog
+        """
         marker = None
         paginator = iam.get_paginator('get_account_authorization_details')
         account_users = []
@@ -138,8 +220,7 @@ class RuntimeIamScanner:
         account_policies = []
         account_groups = []
         response_iterator = paginator.paginate(
-            Filter=['User', 'Role', 'Group',
-                    'LocalManagedPolicy', 'AWSManagedPolicy'],
+            Filter=['User', 'Role', 'Group', 'LocalManagedPolicy'],
             PaginationConfig={
                 'PageSize': 100,
                 'StartingToken': marker
@@ -150,11 +231,54 @@ class RuntimeIamScanner:
             account_roles.extend(page['RoleDetailList'])
             account_groups.extend(page['GroupDetailList'])
             account_policies.extend(page['Policies'])
+        return account_users, account_roles, account_groups, account_policies
+
+    @staticmethod
+    def _get_aws_managed_policies(iam, managed_policy_catalog: ManagedPolicyCatalog) -> list:
+        """
+        Lists the AWS managed policies attached in the account, and completes them with the description and document of their default version
+        from the managed policy catalog. Only the versions missing from the catalog are fetched, using a pool of workers
+        :return: The AWS managed policies in the same format as the policies returned by get_account_authorization_details
+        """
+        aws_managed_policies = []
+        paginator = iam.get_paginator('list_policies')
+        for page in paginator.paginate(Scope='AWS', OnlyAttached=True, PaginationConfig={'PageSize': 100}):
+            aws_managed_policies.extend(page['Policies'])
+
+        def get_policy_version_record(policy: dict) -> dict:
+            record = managed_policy_catalog.get_version(policy['PolicyId'], policy['DefaultVersionId'])
+            if record is None:
+                description = iam.get_policy(PolicyArn=policy['Arn'])['Policy'].get('Description', '')
+                policy_version = iam.get_policy_version(PolicyArn=policy['Arn'], VersionId=policy['DefaultVersionId'])['PolicyVersion']
+                record = managed_policy_catalog.put_version(policy['PolicyId'], policy['Arn'], description, policy_version)
+            return record
+
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            records = list(executor.map(get_policy_version_record, aws_managed_policies))
+        for policy, record in zip(aws_managed_policies, records):
+            policy['Description'] = record['Description']
+            policy['PolicyVersionList'] = [{
+                'Document': managed_policy_catalog.get_document(record['DocumentHash']),
+                'VersionId': record['VersionId'],
+                'IsDefaultVersion': True,
+                'CreateDate': record['CreateDate']
+            }]
+        return aws_managed_policies
 
-        for policy in account_policies:
-            policy['Description'] = iam.get_policy(PolicyArn=policy['Arn'])[
-                'Policy'].get('Description', '')
+    @staticmethod
+    def _filter_account_entities(account_users, account_roles, account_groups, account_policies) -> (list, list, list, list):
+        account_policies = list(
+            filter(lambda p: p['Arn'].split(':')[4] != '', account_policies))
+        account_roles = list(filter(lambda r: r['Arn'].split(
+            '/')[1] != 'aws-service-role', account_roles))
+        return account_users, account_roles, account_groups, account_policies
 
+    @staticmethod
+    def _list_role_descriptions(iam) -> dict:
+        """
+        The authorization details don't include the roles' descriptions, but list_roles does
+        :return: A dict of the format {role_name: description}
+        """
         marker = None
         list_roles_result = []
         paginator = iam.get_paginator('list_roles')
@@ -166,51 +290,206 @@ class RuntimeIamScanner:
         )
         for page in response_iterator:
             list_roles_result.extend(page['Roles'])
+        return {role_obj['RoleName']: role_obj.get('Description', '') for role_obj in list_roles_result}
 
+    @staticmethod
+    def _add_role_descriptions(account_roles: list, role_descriptions: dict):
         for role in account_roles:
-            role['Description'] = next(role_obj.get(
-                'Description', '') for role_obj in list_roles_result if role_obj['RoleName'] == role['RoleName'])
+            role['Description'] = role_descriptions.get(role['RoleName'], '')
 
-        account_policies = list(
-            filter(lambda p: p['Arn'].split(':')[4] != '', account_policies))
-        account_roles = list(filter(lambda r: r['Arn'].split(
-            '/')[1] != 'aws-service-role', account_roles))
-        return account_users, account_roles, account_groups, account_policies
+    @staticmethod
+    def _acquire_credential_report(iam) -> dict:
+        credential_report = RuntimeIamScanner._start_credential_report_generation(iam)
+        if credential_report is None:
+            credential_report = RuntimeIamScanner._get_credential_report(iam)
+        return credential_report
+
+    @staticmethod
+    def _start_credential_report_generation(iam):
+        """
+        Reuses the account's existing credential report if it was generated in the last CREDENTIAL_REPORT_MAX_AGE seconds, otherwise starts
+        generating a new one, which AWS does in the background
+        :return: The existing credential report, as returned by CredentialReport.read, or None if a new one is being generated
+        """
+        try:
+            response = iam.get_credential_report()
+            report_age = datetime.datetime.now(datetime.timezone.utc) - response['GeneratedTime']
+            if report_age.total_seconds() <= CREDENTIAL_REPORT_MAX_AGE:
+                print("Reusing the existing IAM credential report")
+                return CredentialReport.read(response['Content'])
+        except ClientError as exception:
+            if exception.response['Error']['Code'] not in ['ReportNotPresent', 'ReportExpired', 'ReportInProgress']:
+                raise exception
+        iam.generate_credential_report()
+        return None
+
+    @staticmethod
+    def _get_credential_report(iam) -> dict:
+        """
+        Waits for the credential report generation to complete, polling with an exponential backoff, and returns the report
+        """
+        deadline = time.monotonic() + CREDENTIAL_REPORT_DEADLINE
+        poll_interval = MIN_POLL_INTERVAL
+        while iam.generate_credential_report()['State'] != 'COMPLETE':
+            if time.monotonic() + poll_interval > deadline:
+                raise TimeoutError(f"The IAM credential report was not generated within {CREDENTIAL_REPORT_DEADLINE} seconds")
+            time.sleep(poll_interval)
+            poll_interval = min(poll_interval * 2, MAX_POLL_INTERVAL)
+        return CredentialReport.read(iam.get_credential_report()['Content'])
+
+    def _add_last_accessed(self, iam, account_principals: list):
+        """
+        Adds the usage report of every principal. When refreshing incrementally, a principal's previous report is reused if it is younger
+        than LAST_ACCESSED_TTL and the principal's policies haven't changed since
+        """
+        now = int(time.time())
+        principals_to_report = []
+        for principal in account_principals:
+            principal['PolicyHash'] = RuntimeIamScanner._get_policy_hash(principal)
+            previous_principal = self._previous_principals.get(principal['Arn'], {})
+            if 'LastAccessed' in previous_principal and previous_principal.get('PolicyHash') == principal['PolicyHash'] and \
+                    now - previous_principal.get('LastAccessedTime', 0) <= LAST_ACCESSED_TTL:
+                principal['LastAccessed'] = previous_principal['LastAccessed']
+                principal['LastAccessedTime'] = previous_principal['LastAccessedTime']
+            else:
+                principals_to_report.append(principal)
+        if len(principals_to_report) < len(account_principals):
+            print(f"Reusing the usage reports of {len(account_principals) - len(principals_to_report)} unchanged principals")
+
+        last_accessed_map = self._generate_last_access(iam, list(map(lambda e: e['Arn'], principals_to_report)))
+        principals_by_arn = {entity['Arn']: entity for entity in principals_to_report}
+        for arn, last_accessed_list in last_accessed_map.items():
+            principals_by_arn[arn]['LastAccessed'] = last_accessed_list
+            principals_by_arn[arn]['LastAccessedTime'] = now
+
+    @staticmethod
+    def _get_policy_hash(principal: dict) -> str:
+        policy_fields = {field: principal[field] for field in PRINCIPAL_POLICY_FIELDS if field in principal}
+        return hashlib.sha256(json.dumps(policy_fields, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def _add_policy_descriptions(iam, account_policies: list):
+        """
+        The authorization details don't include the policies' descriptions, so they are fetched using a pool of workers sharing the same client
+        :param iam:              AWS IAM client
+        :param account_policies: List of the policies in the account, which will be updated with their descriptions
+        """
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            descriptions = executor.map(lambda policy: iam.get_policy(PolicyArn=policy['Arn'])['Policy'].get('Description', ''),
+                                        account_policies)
+            for policy, description in zip(account_policies, descriptions):
+                policy['Description'] = description
+
+    @staticmethod
+    def _add_login_profiles(iam, account_users: list, credential_report):
+        """
+        Sets LoginProfileExists for every user. The credential report's password_enabled column already answers this for every user it
+        describes, so get_login_profile is only called, concurrently, for users the report doesn't describe (e.g. created after the report
+        was generated, or re-created with the same name)
+        :param iam:               AWS IAM client
+        :param account_users:     List of the users in the account, which will be updated with LoginProfileExists
+        :param credential_report: The credential report, as returned by CredentialReport.read
+        """
+        credentials_by_user = CredentialReport.by_user(credential_report)
+        users_to_probe = []
+        for user in account_users:
+            credentials = credentials_by_user.get(user['UserName'], {})
+            if credentials.get('password_enabled') in ['true', 'false'] and \
+                    RuntimeIamScanner._is_same_creation_time(credentials.get('user_creation_time'), user.get('CreateDate')):
+                user['LoginProfileExists'] = credentials['password_enabled'] == 'true'
+            else:
+                users_to_probe.append(user)
+        if len(users_to_probe) == 0:
+            return
+
+        errors = []
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            futures = {executor.submit(RuntimeIamScanner._login_profile_exists, iam, user['UserName']): user for user in users_to_probe}
+            for future in concurrent.futures.as_completed(futures):
+                try:
+                    futures[future]['LoginProfileExists'] = future.result()
+                except ClientError as exception:
+                    logging.error(f"Caught an error while getting the login profile of {futures[future]['UserName']}, {str(exception)}")
+                    errors.append(exception)
+        if len(errors) > 0:
+            raise errors[0]
+
+    @staticmethod
+    def _login_profile_exists(iam, user_name: str) -> bool:
+        try:
+            iam.get_login_profile(UserName=user_name)
+            return True
+        except ClientError as exception:
+            if exception.response['Error']['Code'] == 'NoSuchEntity':
+                return False
+            raise exception
+
+    @staticmethod
+    def _is_same_creation_time(report_creation_time, create_date) -> bool:
+        if report_creation_time is None or create_date is None:
+            return False
+        if isinstance(create_date, str):
+            create_date = datetime.datetime.fromisoformat(create_date)
+        if isinstance(report_creation_time, str):
+            report_creation_time = CredentialReport.to_epoch(report_creation_time)
+        return report_creation_time == int(create_date.timestamp())
 
     def _generate_last_access(self, iam, arn_list: list):
-        results = {}
-        futures = []
+        """
+        Generates the service last accessed details of all the principals. All the jobs are started up front, and are then polled together
+        with an exponential backoff until they complete or LAST_ACCESSED_DEADLINE seconds pass. The principals whose reports don't complete
+        in time are logged and left out of the result, so they get no LastAccessed - they are treated as used, and are reported again by the
+        next incremental refresh
+        :param iam:      AWS IAM client
+        :param arn_list: The ARNs of the principals to generate the reports for
+        :return: A dict of the format {arn: [{"ServiceNamespace": ..., "LastAccessed": ...}]}
+        """
         print(ERASE_LINE + f"\rGenerating usage reports for {len(arn_list)} principals")
-
-        with concurrent.futures.ThreadPoolExecutor(max_workers=os.getenv("MAX_WORKERS", 5)) as executor:
-            for arn in arn_list:
-                futures.append(executor.submit(
-                    RuntimeIamScanner._generate_last_access_for_entity,
-                    arn,
-                    iam,
-                    results
-                ))
-        concurrent.futures.wait(futures)
+        deadline = time.monotonic() + LAST_ACCESSED_DEADLINE
+        with concurrent.futures.ThreadPoolExecutor(max_workers=MAX_WORKERS) as executor:
+            job_ids = executor.map(lambda arn: iam.generate_service_last_accessed_details(Arn=arn)['JobId'], arn_list)
+            pending_jobs = dict(zip(arn_list, job_ids))
+
+            results = {}
+            poll_interval = MIN_POLL_INTERVAL
+            while len(pending_jobs) > 0:
+                arns = list(pending_jobs.keys())
+                for arn, services_last_accessed in zip(arns, executor.map(
+                        lambda a: RuntimeIamScanner._get_last_access_job_result(iam, a, pending_jobs[a]), arns)):
+                    if services_last_accessed is not None:
+                        results[arn] = RuntimeIamScanner.simplify_service_access_result(services_last_accessed)
+                        del pending_jobs[arn]
+                print(ERASE_LINE + f"\rReceived reports for {len(results)} of {len(arn_list)} principals", end="")
+                if len(pending_jobs) == 0:
+                    break
+                if time.monotonic() + poll_interval > deadline:
+                    print()
+                    self.logger.warning(f"The service last accessed reports of {len(pending_jobs)} principals did not complete within "
+                                        f"{LAST_ACCESSED_DEADLINE} seconds, so their usage is unknown and they will be treated as used: "
+                                        f"{', '.join(pending_jobs.keys())}")
+                    return results
+                time.sleep(poll_interval)
+                poll_interval = min(poll_interval * 2, MAX_POLL_INTERVAL)
         print(f"\rReceived reports for {len(arn_list)} principals")
         return results
 
     @staticmethod
-    def _generate_last_access_for_entity(arn: str, iam: boto3.client, results: dict):
-        try:
-            print(f"Generating report for {arn}")
-            job_id = iam.generate_service_last_accessed_details(Arn=arn)['JobId']
-            result = {'JobStatus': 'IN_PROGRESS'}
-            for i in range(3):
-                result = iam.get_service_last_accessed_details(JobId=job_id)
-                if result['JobStatus'] != 'COMPLETED':
-                    time.sleep(3)
-                else:
-                    break
-            results[arn] = RuntimeIamScanner.simplify_service_access_result(result['ServicesLastAccessed'])
-        except Exception as err:
-            logging.error(f"Caught an error while getting the service last accessed details for {arn}, {str(err)}")
-            del results[arn]
-            raise err
+    def _get_last_access_job_result(iam, arn: str, job_id: str):
+        """
+        :return: The complete ServicesLastAccessed list if the job has completed, or None if it is still in progress
+        """
+        result = iam.get_service_last_accessed_details(JobId=job_id)
+        if result['JobStatus'] == 'IN_PROGRESS':
+            return None
+        if result['JobStatus'] == 'FAILED':
+            error = result.get('Error', {})
+            logging.error(f"Caught an error while getting the service last accessed details for {arn}, {error.get('Message')}")
+            raise RuntimeError(f"The service last accessed job of {arn} failed: {error.get('Code')}")
+        services_last_accessed = result['ServicesLastAccessed']
+        while result.get('IsTruncated'):
+            result = iam.get_service_last_accessed_details(JobId=job_id, Marker=result['Marker'])
+            services_last_accessed += result['ServicesLastAccessed']
+        return services_last_accessed
 
     @staticmethod
     def convert_csv_to_json(csv_report: str):
@@ -219,17 +498,8 @@ class RuntimeIamScanner:
         :param csv_report: a csv string, delimited with "," and rows split with "\n"
         :return: The csv as a json array
         """
-        json_report = []
-        rows = csv_report.split('\n')
-        headers = rows[0].split(',')
-        for row in rows[1:]:
-            values = row.split(',')
-            entity = {}
-            for i in range(len(values)):
-                if values[i] != 'N/A':
-                    entity[headers[i]] = values[i]
-            json_report.append(entity)
-        return json_report
+        return [{header: value for header, value in row.items() if value != 'N/A'}
+                for row in csv.DictReader(io.StringIO(csv_report, newline=''))]
 
     @staticmethod
     def simplify_service_access_result(service_access_list: list):
@@ -241,17 +511,16 @@ class RuntimeIamScanner:
         return list(map(lambda last_access: {"ServiceNamespace": last_access["ServiceNamespace"], "LastAccessed": last_access["LastAuthenticated"]},
                         filter(lambda last_access: last_access['TotalAuthenticatedEntities'] > 0, service_access_list)))
 
+    @staticmethod
+    def _assume_role(session, role_arn: str):
+        """
+        :return: A session with the credentials of role_arn, which is assumed using the credentials of the given session
+        """
+        credentials = session.client('sts').assume_role(RoleArn=role_arn, RoleSessionName='AirIAM')['Credentials']
+        return boto3.Session(aws_access_key_id=credentials['AccessKeyId'], aws_secret_access_key=credentials['SecretAccessKey'],
+                             aws_session_token=credentials['SessionToken'])
+
     def _get_identity_details(self) -> (str, str):
         caller_identity_resp = self._session.client(
             'sts').get_caller_identity()
         return caller_identity_resp['Account'], caller_identity_resp['Arn']
-
-    @staticmethod
-    def _get_account_id_from_existing_data(account_id=None):
-        # noinspection PyBroadException
-        try:
-            with open(get_iam_data_file(account_id=account_id)) as iam_data_file:
-                iam_data = json.load(iam_data_file)
-            return iam_data['AccountUsers'][0]['Arn'].split(":")[4]
-        except Exception:
-            return ""
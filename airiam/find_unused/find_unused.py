@@ -1,17 +1,25 @@
+import concurrent.futures
 import copy
-import datetime as dt
 import logging
-from datetime import timezone
+import time
 
-from airiam.find_unused.PolicyAnalyzer import PolicyAnalyzer
+from airiam.config import MAX_PROCESSES
+from airiam.find_unused.Dates import Dates
+from airiam.find_unused.IamDataCache import IamDataCache
+from airiam.find_unused.PolicyAnalyzer import PolicyAnalysis, PolicyAnalysisCache
 from airiam.find_unused.RuntimeIamScanner import RuntimeIamScanner
+from airiam.models.ConsolidatedReport import ConsolidatedReport
+from airiam.models.IamDataIndex import IamDataIndex
+
+# The credential report columns which tell when a user last used its credentials
+LAST_USED_COLUMNS = ['access_key_1_last_used_date', 'access_key_2_last_used_date', 'password_last_used']
 
 
 def filter_attachments_of_unused_entities(unused_policy_attachments, unused_users, unused_roles,
                                           redundant_groups) -> list:
-    unused_role_names = list(map(lambda role_obj: role_obj['RoleName'], unused_roles))
-    unused_user_names = list(map(lambda user_obj: user_obj['UserName'], unused_users))
-    redundant_group_names = list(map(lambda group_obj: group_obj['GroupName'], redundant_groups))
+    unused_role_names = set(map(lambda role_obj: role_obj['RoleName'], unused_roles))
+    unused_user_names = set(map(lambda user_obj: user_obj['UserName'], unused_users))
+    redundant_group_names = set(map(lambda group_obj: group_obj['GroupName'], redundant_groups))
     unused_policy_attachments_of_in_use_principals = []
     for policy_attachment_obj in unused_policy_attachments:
         if 'Role' in policy_attachment_obj:
@@ -29,38 +37,39 @@ def filter_attachments_of_unused_entities(unused_policy_attachments, unused_user
 
 def filter_credentials_of_unused_users(unused_active_access_keys, unused_console_login_profiles, unused_users) -> (
                                        list, list):
-    result_access_keys = []
-    result_console_logins = []
-    for access_key in unused_active_access_keys:
-        is_belong_to_unused_user = len(
-            list(filter(lambda user: user['UserName'] == access_key['User'], unused_users))) > 0
-        if not is_belong_to_unused_user:
-            result_access_keys.append(access_key)
-    for console_login in unused_console_login_profiles:
-        is_belong_to_unused_user = len(
-            list(filter(lambda user: user['UserName'] == console_login['User'], unused_users))) > 0
-        if not is_belong_to_unused_user:
-            result_console_logins.append(console_login)
+    unused_user_names = set(map(lambda user: user['UserName'], unused_users))
+    result_access_keys = [access_key for access_key in unused_active_access_keys if access_key['User'] not in unused_user_names]
+    result_console_logins = [console_login for console_login in unused_console_login_profiles
+                             if console_login['User'] not in unused_user_names]
     return result_access_keys, result_console_logins
 
 
-def find_unused(logger, profile, refresh_cache, unused_threshold, command):
-    iam_report = RuntimeIamScanner(logger, profile, refresh_cache).evaluate_runtime_iam(True, command)
+def find_unused(logger, profile, refresh_cache, unused_threshold, command, collection_backend='sync', incremental=False,
+                max_cache_age=None, role_arn=None, now=None):
+    """
+    :param now: The time, in epoch seconds, against which it is measured how long ago the entities were used. Defaults to the current time
+    """
+    iam_report = RuntimeIamScanner(logger, profile, refresh_cache, collection_backend, incremental, max_cache_age, role_arn)\
+        .evaluate_runtime_iam(True, command)
     raw_iam_data = iam_report.get_raw_data()
+    iam_data_index = iam_report.get_index()
     credential_report = raw_iam_data['CredentialReport']
     account_users = raw_iam_data['AccountUsers']
     account_roles = raw_iam_data['AccountRoles']
     account_policies = raw_iam_data['AccountPolicies']
     account_groups = raw_iam_data['AccountGroups']
-    unused_users, used_users = find_unused_users(account_users, credential_report, unused_threshold)
+    now = now if now is not None else int(time.time())
+    unused_users, used_users = find_unused_users(account_users, credential_report, unused_threshold, iam_data_index, now)
     unused_active_access_keys, unused_console_login_profiles = find_unused_active_credentials(account_users,
                                                                                               credential_report,
-                                                                                              unused_threshold)
+                                                                                              unused_threshold,
+                                                                                              iam_data_index, now)
     unattached_policies = find_unattached_policies(account_policies)
     redundant_groups = find_redundant_groups(account_groups, account_users)
-    unused_roles, used_roles = find_unused_roles(account_roles, unused_threshold)
+    unused_roles, used_roles = find_unused_roles(account_roles, unused_threshold, iam_data_index, now)
     unused_policy_attachments = find_unused_policy_attachments(account_users, account_roles, account_policies,
-                                                               account_groups, unused_threshold)
+                                                               account_groups, unused_threshold,
+                                                               iam_data_index=iam_data_index, now=now)
 
     unused_access_keys, unused_console_access = filter_credentials_of_unused_users(unused_active_access_keys,
                                                                                    unused_console_login_profiles,
@@ -73,17 +82,48 @@ def find_unused(logger, profile, refresh_cache, unused_threshold, command):
     return iam_report
 
 
-def find_unused_users(users, credential_report, unused_threshold) -> (list, list):
+def find_unused_in_accounts(logger, accounts, profile, refresh_cache, unused_threshold, command, collection_backend='sync',
+                            incremental=False, max_cache_age=None) -> ConsolidatedReport:
+    """
+    Finds the unused entities of several accounts, scanning up to MAX_PROCESSES accounts in parallel, each in its own process
+    :param accounts: A list of AWS profiles and role ARNs. Roles are assumed using the credentials of profile
+    :return: A report which consolidates the findings of all the accounts which were scanned successfully
+    """
+    reports = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=min(MAX_PROCESSES, len(accounts))) as executor:
+        futures = {executor.submit(_find_unused_in_account, account, profile, refresh_cache, unused_threshold, command, collection_backend,
+                                   incremental, max_cache_age): account for account in accounts}
+        for future in concurrent.futures.as_completed(futures):
+            try:
+                reports.append(future.result())
+            except Exception as e:
+                logger.error(f'Failed to scan {futures[future]}: {str(e)}')
+    if len(reports) == 0:
+        raise RuntimeError('Failed to scan all the accounts')
+    return ConsolidatedReport(reports)
+
+
+def _find_unused_in_account(account, profile, refresh_cache, unused_threshold, command, collection_backend, incremental,
+                            max_cache_age):
+    """
+    Runs in a worker process, so it only sends the findings back to the parent process, after the local cache was written
+    """
+    if account.startswith('arn:'):
+        report = find_unused(logging, profile, refresh_cache, unused_threshold, command, collection_backend, incremental, max_cache_age,
+                             role_arn=account)
+    else:
+        report = find_unused(logging, account, refresh_cache, unused_threshold, command, collection_backend, incremental, max_cache_age)
+    IamDataCache.wait_for_pending_writes()
+    return report.without_raw_data()
+
+
+def find_unused_users(users, credential_report, unused_threshold, iam_data_index: IamDataIndex = None, now=None) -> (list, list):
+    iam_data_index = iam_data_index or IamDataIndex(credential_report=credential_report)
+    days_since_used = _get_days_since_credentials_used(users, iam_data_index, now)
     unused_users = []
     used_users = []
-    for user in users:
-        credentials = next((creds for creds in credential_report if creds['user'] == user['UserName']), {})
-
-        findMinimumUsed = [
-            days_from_today(credentials.get('access_key_1_last_used_date', 'N/A')),
-            days_from_today(credentials.get('access_key_2_last_used_date', 'N/A')),
-            days_from_today(credentials.get('password_last_used', 'N/A'))
-        ]
+    for i, user in enumerate(users):
+        findMinimumUsed = days_since_used[i * len(LAST_USED_COLUMNS):(i + 1) * len(LAST_USED_COLUMNS)]
         try:
             # Needs to be >= here not just >, as we need to catch "0" for accessed "today", which will fail both if
             # and elif below and put the user into "used_users" so any unused keys can be caught later.
@@ -103,28 +143,29 @@ def find_unused_users(users, credential_report, unused_threshold) -> (list, list
     return unused_users, used_users
 
 
-def find_unused_active_credentials(users, credential_report, unused_threshold) -> (list, list):
+def find_unused_active_credentials(users, credential_report, unused_threshold,
+                                   iam_data_index: IamDataIndex = None, now=None) -> (list, list):
+    iam_data_index = iam_data_index or IamDataIndex(credential_report=credential_report)
+    days_since_used = _get_days_since_credentials_used(users, iam_data_index, now)
     unused_access_keys = []
     unused_console_login_profiles = []
-    for user in users:
-        try:
-            credentials = next(creds for creds in credential_report if creds['user'] == user['UserName'])
-        except StopIteration:
+    for i, user in enumerate(users):
+        credentials = iam_data_index.credentials_by_user.get(user['UserName'])
+        if credentials is None:
             logging.warning(f'Failed to find credentials for user {user["UserName"]}, skipping this user')
             continue
-        access_key_1_unused_days = days_from_today(credentials.get('access_key_1_last_used_date', 'N/A'))
+        access_key_1_unused_days, access_key_2_unused_days, days_since_password_last_used = \
+            days_since_used[i * len(LAST_USED_COLUMNS):(i + 1) * len(LAST_USED_COLUMNS)]
         if ((credentials['access_key_1_active'] == 'true') and (
                 (access_key_1_unused_days < 0) or (access_key_1_unused_days >= unused_threshold))):
             unused_access_keys.append(
                 {'User': user['UserName'], 'AccessKey': '1', 'DaysSinceLastUse': access_key_1_unused_days})
 
-        access_key_2_unused_days = days_from_today(credentials.get('access_key_2_last_used_date', 'N/A'))
         if ((credentials['access_key_2_active'] == 'true') and (
                 (access_key_2_unused_days < 0) or (access_key_2_unused_days >= unused_threshold))):
             unused_access_keys.append(
                 {'User': user['UserName'], 'AccessKey': '2', 'DaysSinceLastUse': access_key_2_unused_days})
 
-        days_since_password_last_used = days_from_today(credentials.get('password_last_used', 'N/A'))
         if ((credentials['password_enabled'] == 'true') and (
                 (days_since_password_last_used < 0) or (days_since_password_last_used >= unused_threshold))):
             unused_console_login_profiles.append(
@@ -133,7 +174,22 @@ def find_unused_active_credentials(users, credential_report, unused_threshold) -
     return unused_access_keys, unused_console_login_profiles
 
 
-def find_unused_roles(roles, unused_threshold) -> (list, list):
+def _get_days_since_credentials_used(users, iam_data_index: IamDataIndex, now=None):
+    """
+    :return: The days since each of the LAST_USED_COLUMNS was used, for every user one after the other, computed in a single pass
+    """
+    now = now if now is not None else int(time.time())
+    epochs = Dates.to_epochs(iam_data_index.credentials_by_user.get(user['UserName'], {}).get(column)
+                             for user in users for column in LAST_USED_COLUMNS)
+    return Dates.days_since(epochs, now)
+
+
+def find_unused_roles(roles, unused_threshold, iam_data_index: IamDataIndex = None, now=None) -> (list, list):
+    iam_data_index = iam_data_index or IamDataIndex()
+    now = now if now is not None else int(time.time())
+    accessed_roles = [role for role in roles if role.get('LastAccessed')]
+    days_since_used = Dates.days_since([max(iam_data_index.get_last_accessed(role)[1]) for role in accessed_roles], now)
+    days_since_used_by_role = {role['RoleName']: days for role, days in zip(accessed_roles, days_since_used)}
     unused_roles = []
     used_roles = []
     for role in roles:
@@ -143,8 +199,7 @@ def find_unused_roles(roles, unused_threshold) -> (list, list):
             role['LastUsed'] = -1
             unused_roles.append(role)
         else:
-            last_used = max(map(lambda last_access: last_access['LastAccessed'], role.get('LastAccessed', [])))
-            role['LastUsed'] = days_from_today(last_used)
+            role['LastUsed'] = days_since_used_by_role[role['RoleName']]
             if (role['LastUsed'] < 0) or (role['LastUsed'] >= unused_threshold):
                 unused_roles.append(role)
             else:
@@ -166,47 +221,41 @@ def find_redundant_groups(groups, users) -> list:
 
 def _find_groups_with_no_members(group_list: list, user_list: list):
     """
-    Identify groups with no members by going through the
+    Identify groups with no members by collecting the names of all the groups the users are members of
     :param group_list: List of the groups in the account
     :param user_list:  List of the active IAM users in the account
     :return: List of groups which have no active IAM users as members
     """
-    empty_groups = copy.deepcopy(group_list)
-    for user in user_list:
-        for group in user['GroupList']:
-            try:
-                group_obj = next(g for g in empty_groups if g['GroupName'] == group)
-                empty_groups.remove(group_obj)
-            except StopIteration:
-                pass
-
-    return empty_groups
+    groups_with_members = {group_name for user in user_list for group_name in user['GroupList']}
+    return [group for group in group_list if group['GroupName'] not in groups_with_members]
 
 
 def find_unused_policy_attachments(users: list, roles: dict, account_policies: list, account_groups: list,
-                                   unused_threshold) -> list:
+                                   unused_threshold, policy_analysis_cache: PolicyAnalysisCache = None,
+                                   iam_data_index: IamDataIndex = None, now=None) -> list:
+    policy_analysis_cache = policy_analysis_cache or PolicyAnalysisCache()
+    iam_data_index = iam_data_index or IamDataIndex(groups=account_groups, policies=account_policies)
+    now = now if now is not None else int(time.time())
     unused_policy_attachments = []
     for role in roles:
-        unused_policy_attachments += get_unused_role_policy_attachments(account_policies, role)
+        unused_policy_attachments += get_unused_role_policy_attachments(account_policies, role, policy_analysis_cache,
+                                                                        iam_data_index)
 
     used_group_policy_attachments = []
     potential_unused_group_policy_attachments = []
     for user in users:
-        services_in_use = list(map(lambda last_access: last_access['ServiceNamespace'],
-                                   filter(lambda last_access: days_from_today(
-                                       last_access['LastAccessed']) > 0 < unused_threshold, user['LastAccessed'])))
+        services, last_accessed_epochs = iam_data_index.get_last_accessed(user)
+        services_in_use = [service for service, days in zip(services, Dates.days_since(last_accessed_epochs, now))
+                           if days > 0 < unused_threshold]
         user_attached_managed_policies = copy.deepcopy(user['AttachedManagedPolicies'])
         for group_name in user['GroupList']:
-            group_managed_policies = next(
-                g['AttachedManagedPolicies'] for g in account_groups if g['GroupName'] == group_name)
+            group_managed_policies = iam_data_index.groups_by_name[group_name]['AttachedManagedPolicies']
             user_attached_managed_policies.extend(
                 list(map(lambda group_policy: {**group_policy, 'Group': group_name}, group_managed_policies)))
 
         for policy_attachment_obj in user_attached_managed_policies:
-            policy_obj = next(p for p in account_policies if policy_attachment_obj['PolicyArn'] == p['Arn'])
-            policy_document = \
-            next(version for version in policy_obj['PolicyVersionList'] if version['IsDefaultVersion'])['Document']
-            policy_is_unused = PolicyAnalyzer.is_policy_unused(policy_document, services_in_use)
+            policy_obj = iam_data_index.policies_by_arn[policy_attachment_obj['PolicyArn']]
+            policy_is_unused = policy_analysis_cache.get_analysis(policy_obj).is_unused(services_in_use)
             if policy_attachment_obj.get('Group'):
                 attachment_id = f'{policy_attachment_obj["PolicyName"]}/{policy_attachment_obj["Group"]}'
                 if policy_is_unused:
@@ -225,28 +274,25 @@ def find_unused_policy_attachments(users: list, roles: dict, account_policies: l
     return unused_policy_attachments
 
 
-def get_unused_role_policy_attachments(account_policies, principal):
+def get_unused_role_policy_attachments(account_policies, principal, policy_analysis_cache: PolicyAnalysisCache = None,
+                                       iam_data_index: IamDataIndex = None):
+    policy_analysis_cache = policy_analysis_cache or PolicyAnalysisCache()
+    iam_data_index = iam_data_index or IamDataIndex(policies=account_policies)
     unused_policy_attachments = []
     if principal.get('LastAccessed') is None:
         return unused_policy_attachments
     services_last_accessed = list(map(lambda access_obj: access_obj['ServiceNamespace'], principal.get('LastAccessed')))
     for managed_policy in principal['AttachedManagedPolicies']:
-        policy_obj = next(pol for pol in account_policies if pol['Arn'] == managed_policy['PolicyArn'])
-        policy_document = next(version for version in policy_obj['PolicyVersionList'] if version['IsDefaultVersion'])[
-            'Document']
-        if PolicyAnalyzer.is_policy_unused(policy_document, services_last_accessed):
+        policy_obj = iam_data_index.policies_by_arn[managed_policy['PolicyArn']]
+        if policy_analysis_cache.get_analysis(policy_obj).is_unused(services_last_accessed):
             unused_policy_attachments.append({"Role": principal['RoleName'], "PolicyArn": managed_policy['PolicyArn']})
     for inline_policy in principal.get('RolePolicyList', []):
-        if PolicyAnalyzer.is_policy_unused(inline_policy['PolicyDocument'], services_last_accessed):
+        if PolicyAnalysis(inline_policy['PolicyDocument']).is_unused(services_last_accessed):
             unused_policy_attachments.append({"Role": principal['RoleName'], "PolicyArn": inline_policy['PolicyName']})
 
     return unused_policy_attachments
 
 
-def days_from_today(str_date_from_today):
-    if str_date_from_today in ['no_information', 'N/A']:
-        return -1
-    date = dt.datetime.fromisoformat(str_date_from_today)
-    delta = dt.datetime.now().astimezone(timezone.utc) - date
-
-    return delta.days
+def days_from_today(str_date_from_today, now=None):
+    now = now if now is not None else int(time.time())
+    return Dates.days_since([Dates.to_epoch(str_date_from_today)], now)[0]
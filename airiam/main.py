@@ -1,11 +1,14 @@
 import argparse
+import contextlib
 import logging
 import sys
 
 from airiam.Reporter import Reporter, OutputFormat
-from airiam.find_unused.find_unused import find_unused
+from airiam.find_unused.ActionTable import ActionTable
+from airiam.find_unused.RuntimeIamScanner import COLLECTION_BACKENDS
+from airiam.find_unused.find_unused import find_unused, find_unused_in_accounts
 from airiam.recommend_groups.recommend_groups import recommend_groups
-from airiam.terraform.TerraformTransformer import TerraformTransformer
+from airiam.terraform.TerraformTransformer import TerraformTransformer, IMPORT_MODES
 
 
 def configure_logger(logging_level=logging.INFO):
@@ -23,13 +26,39 @@ def configure_logger(logging_level=logging.INFO):
 def run():
     logger = configure_logger()
 
-    Reporter.print_prelude()
     args = parse_args(sys.argv[1:])
+    if args.command == 'find_unused' and args.output != OutputFormat.cli and args.output_file is None:
+        # Everything but the report itself is printed to stderr, so the report can be piped from stdout as is
+        report_output = sys.stdout
+        with contextlib.redirect_stdout(sys.stderr):
+            _run(logger, args, report_output)
+    else:
+        _run(logger, args, sys.stdout)
+
 
-    runtime_results = find_unused(logger, args.profile, args.no_cache, args.last_used_threshold, args.command)
+def _run(logger, args, report_output):
+    Reporter.print_prelude()
+
+    if args.command == 'refresh_actions':
+        print(f'Refreshed the IAM actions table at {ActionTable.refresh()}')
+        exit()
+
+    max_cache_age = args.max_cache_age * 60 * 60 if args.max_cache_age is not None else None
+    if args.command == 'find_unused' and args.accounts:
+        runtime_results = find_unused_in_accounts(logger, args.accounts, args.profile, args.no_cache, args.last_used_threshold, args.command,
+                                                  args.collection_backend, args.incremental, max_cache_age)
+    else:
+        runtime_results = find_unused(logger, args.profile, args.no_cache, args.last_used_threshold, args.command,
+                                      args.collection_backend, args.incremental, max_cache_age)
 
     if args.command == 'find_unused':
-        Reporter.report_unused(runtime_results)
+        if args.output == OutputFormat.cli:
+            Reporter.report_unused(runtime_results, args.interactive)
+        elif args.output_file:
+            with open(args.output_file, 'w') as output_file:
+                Reporter.write_unused(runtime_results, args.output, output_file)
+        else:
+            Reporter.write_unused(runtime_results, args.output, report_output)
         exit()
 
     if args.command == 'recommend_groups' or args.command == 'terraform' and not args.without_groups:
@@ -40,7 +69,7 @@ def run():
 
     if args.command == 'terraform':
         entities_terraformed, result_dir = TerraformTransformer(logger, args.profile, args.directory)\
-            .transform(runtime_results, args.without_unused, args.without_groups, args.without_import)
+            .transform(runtime_results, args.without_unused, args.without_groups, args.without_import, args.import_mode)
         Reporter.report_terraform(entities_terraformed, result_dir)
 
 
@@ -55,17 +84,38 @@ def parse_args(args):
     find_unused_parser.add_argument('-l', '--last-used-threshold', help='"Last Used" threshold, in days, for an entity to be considered unused',
                                     type=int, default=90)
     find_unused_parser.add_argument('--no-cache', help='Generate a fresh set of data from AWS IAM API calls', action='store_true')
-    find_unused_parser.add_argument('-o', '--output', help='Output format', type=OutputFormat,
-                                    choices=[output.name for output in OutputFormat], default=OutputFormat.cli)
+    find_unused_parser.add_argument('--max-cache-age', type=int, default=None,
+                                    help='Maximal age, in hours, of the local data to reuse. Older data is fetched again from AWS')
+    find_unused_parser.add_argument('--incremental', action='store_true',
+                                    help='Refresh the local data, but only re-generate the usage reports of principals whose policies changed '
+                                         'or whose reports are older than LAST_ACCESSED_TTL seconds')
+    find_unused_parser.add_argument('--collection-backend', help='How to collect the data from AWS: sync runs the collection stages one after '
+                                    'the other, asyncio overlaps them', type=str, choices=COLLECTION_BACKENDS, default='sync')
+    find_unused_parser.add_argument('--accounts', nargs='+', default=None, metavar='ACCOUNT',
+                                    help='Scan several accounts in parallel and report their findings together. Each account is either an AWS '
+                                         'profile or the ARN of a role to assume using the credentials of --profile')
+    find_unused_parser.add_argument('-o', '--output', help='Output format', type=OutputFormat.from_name, choices=list(OutputFormat),
+                                    default=OutputFormat.cli)
+    find_unused_parser.add_argument('--interactive', '--pace', action='store_true',
+                                    help='Pause between the sections of the cli output. Ignored when the output isn\'t a terminal')
+    find_unused_parser.add_argument('--output-file', type=str, default=None,
+                                    help='File to write the json, jsonl or sarif output to. When omitted, it is written to stdout')
 
     recommend_groups_parser = sub_parsers.add_parser('recommend_groups', help='Recommend IAM groups according to IAM users and their in-use privileges',
                                                      formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     recommend_groups_parser.add_argument('-p', '--profile', help='AWS profile to be used', type=str, default=None)
-    recommend_groups_parser.add_argument('-o', '--output', help='Output format', type=OutputFormat,
-                                         choices=[output.name for output in OutputFormat], default=OutputFormat.cli)
+    recommend_groups_parser.add_argument('-o', '--output', help='Output format', type=OutputFormat.from_name, choices=[OutputFormat.cli],
+                                         default=OutputFormat.cli)
     recommend_groups_parser.add_argument('-l', '--last-used-threshold', type=int, default=90,
                                          help='"Last Used" threshold, in days, for an entity to be considered unused')
     recommend_groups_parser.add_argument('--no-cache', help='Generate a fresh set of data from AWS IAM API calls', action='store_true')
+    recommend_groups_parser.add_argument('--max-cache-age', type=int, default=None,
+                                         help='Maximal age, in hours, of the local data to reuse. Older data is fetched again from AWS')
+    recommend_groups_parser.add_argument('--incremental', action='store_true',
+                                         help='Refresh the local data, but only re-generate the usage reports of principals whose policies changed '
+                                              'or whose reports are older than LAST_ACCESSED_TTL seconds')
+    recommend_groups_parser.add_argument('--collection-backend', help='How to collect the data from AWS: sync runs the collection stages one after '
+                                         'the other, asyncio overlaps them', type=str, choices=COLLECTION_BACKENDS, default='sync')
 
     tf_parser = sub_parsers.add_parser('terraform', help='Terraformize your runtime AWS IAM configurations',
                                        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
@@ -76,8 +126,22 @@ def parse_args(args):
     tf_parser.add_argument('-l', '--last-used-threshold', help='"Last Used" threshold, in days, for an entity to be considered unused', type=int,
                            default=90)
     tf_parser.add_argument('--no-cache', help='Generate a fresh set of data from AWS IAM API calls', action='store_true')
+    tf_parser.add_argument('--max-cache-age', type=int, default=None,
+                           help='Maximal age, in hours, of the local data to reuse. Older data is fetched again from AWS')
+    tf_parser.add_argument('--incremental', action='store_true',
+                           help='Refresh the local data, but only re-generate the usage reports of principals whose policies changed '
+                                'or whose reports are older than LAST_ACCESSED_TTL seconds')
+    tf_parser.add_argument('--collection-backend', help='How to collect the data from AWS: sync runs the collection stages one after '
+                           'the other, asyncio overlaps them', type=str, choices=COLLECTION_BACKENDS, default='sync')
     tf_parser.add_argument('--without-import', help='Import the resulting entities to terraform\'s state file. Note - this might take a long time',
                            action='store_true')
+    tf_parser.add_argument('--import-mode', type=str, choices=IMPORT_MODES, default='cli',
+                           help='How to import the existing entities: cli runs terraform import for every entity, blocks writes import blocks '
+                                'to imports.tf which a single terraform apply imports at once (requires Terraform 1.5+), and state writes '
+                                'terraform.tfstate straight from the collected data')
+
+    sub_parsers.add_parser('refresh_actions', help='Download the latest IAM actions table into the local cache',
+                           formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     result = parser.parse_args(args)
     if result.version:
         Reporter.print_version()
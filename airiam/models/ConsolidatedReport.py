@@ -0,0 +1,21 @@
+class ConsolidatedReport:
+    """
+    The reports of several accounts which were scanned together. Its findings are those of all the accounts, each tagged with the AccountId
+    it was found in, so it can be reported just like the RuntimeReport of a single account
+    """
+
+    def __init__(self, reports: list):
+        self._reports = sorted(reports, key=lambda report: report.account_id)
+
+    def get_reports(self) -> list:
+        return self._reports
+
+    def get_account_ids(self) -> list:
+        return [report.account_id for report in self._reports]
+
+    def get_unused(self) -> dict:
+        unused = {}
+        for report in self._reports:
+            for finding_type, findings in report.get_unused().items():
+                unused.setdefault(finding_type, []).extend({**finding, 'AccountId': report.account_id} for finding in findings or [])
+        return unused
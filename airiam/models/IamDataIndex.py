@@ -0,0 +1,36 @@
+from array import array
+
+from airiam.find_unused.CredentialReport import CredentialReport
+from airiam.find_unused.Dates import Dates
+
+
+class IamDataIndex:
+    """
+    Hash-indexed views of the raw IAM data, built once so the analysis never has to scan an entity list to find an entity by its key
+    """
+
+    def __init__(self, users=(), roles=(), groups=(), policies=(), credential_report=None):
+        self.users_by_name = {user['UserName']: user for user in users}
+        self.roles_by_name = {role['RoleName']: role for role in roles}
+        self.groups_by_name = {group['GroupName']: group for group in groups}
+        self.policies_by_arn = {policy['Arn']: policy for policy in policies}
+        self.credentials_by_user = CredentialReport.by_user(credential_report or {})
+        self._last_accessed_by_arn = {}
+        for principal in list(users) + list(roles):
+            self.get_last_accessed(principal)
+
+    def get_last_accessed(self, principal: dict) -> (list, array):
+        """
+        The dates of a principal's usage report are parsed once, when the index is built
+        :return: The namespaces of the services the principal accessed, and the epoch time at which each of them was last accessed
+        """
+        if principal['Arn'] not in self._last_accessed_by_arn:
+            last_accessed = principal.get('LastAccessed') or []
+            self._last_accessed_by_arn[principal['Arn']] = ([last_access['ServiceNamespace'] for last_access in last_accessed],
+                                                            Dates.to_epochs(last_access['LastAccessed'] for last_access in last_accessed))
+        return self._last_accessed_by_arn[principal['Arn']]
+
+    @staticmethod
+    def from_raw_data(raw_iam_data: dict):
+        return IamDataIndex(raw_iam_data.get('AccountUsers', []), raw_iam_data.get('AccountRoles', []), raw_iam_data.get('AccountGroups', []),
+                            raw_iam_data.get('AccountPolicies', []), raw_iam_data.get('CredentialReport', {}))
@@ -1,3 +1,7 @@
+import copy
+
+from airiam.models.IamDataIndex import IamDataIndex
+
 SORT_KEY_BY_ENTITY_TYPE = {
     'AccountGroups': 'GroupName',
     'AccountPolicies': 'Arn',
@@ -11,6 +15,7 @@ class RuntimeReport:
         self.account_id = account_id
         self.identity_arn = identity_arn
         self._raw_results = raw_results
+        self._index = None
         self._unused_users = None
         self._unused_roles = None
         self._unattached_policies = None
@@ -23,6 +28,20 @@ class RuntimeReport:
     def get_raw_data(self) -> dict:
         return self._raw_results
 
+    def without_raw_data(self) -> 'RuntimeReport':
+        """
+        :return: A copy of the report which holds only its findings, which is much cheaper to send between processes
+        """
+        report = copy.copy(self)
+        report._raw_results = {}
+        report._index = None
+        return report
+
+    def get_index(self) -> IamDataIndex:
+        if self._index is None:
+            self._index = IamDataIndex.from_raw_data(self._raw_results)
+        return self._index
+
     def get_unused(self) -> dict:
         return {
             'Users': self._unused_users,
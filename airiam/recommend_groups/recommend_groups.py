@@ -1,8 +1,10 @@
 import copy
+import time
 
-from airiam.find_unused.find_unused import days_from_today
+from airiam.find_unused.Dates import Dates
+from airiam.models.IamDataIndex import IamDataIndex
 from airiam.models.RuntimeReport import RuntimeReport
-from airiam.find_unused.PolicyAnalyzer import PolicyAnalyzer
+from airiam.find_unused.PolicyAnalyzer import PolicyAnalysisCache
 
 ADMIN_POLICY_ARN = 'arn:aws:iam::aws:policy/AdministratorAccess'
 READ_ONLY_ARN = 'arn:aws:iam::aws:policy/ReadOnlyAccess'
@@ -22,10 +24,15 @@ def recommend_groups(logger, runtime_iam_report: RuntimeReport, last_used_thresh
 
 
 class UserOrganizer:
-    def __init__(self, logger, unused_threshold=90):
+    def __init__(self, logger, unused_threshold=90, now=None):
+        """
+        :param now: The time, in epoch seconds, against which it is measured how long ago the services were used. Defaults to the current time
+        """
         super().__init__()
         self.logger = logger
         self.unused_threshold = unused_threshold
+        self.now = now
+        self.policy_analysis_cache = PolicyAnalysisCache()
 
     def get_user_clusters(self, runtime_report: RuntimeReport) -> dict:
         """
@@ -35,42 +42,36 @@ class UserOrganizer:
         """
         iam_data = runtime_report.get_raw_data()
         human_users, service_users = self._separate_user_types(iam_data['AccountUsers'])
-        simple_user_clusters = self._create_simple_user_clusters(human_users, iam_data['AccountGroups'], iam_data['AccountPolicies'])
+        simple_user_clusters = self._create_simple_user_clusters(human_users, runtime_report.get_index())
         return simple_user_clusters
 
-    def _create_simple_user_clusters(self, users, account_groups, account_policies):
+    def _create_simple_user_clusters(self, users, iam_data_index: IamDataIndex):
         clusters = {
             'Admins': {'Policies': [ADMIN_POLICY_ARN], 'Users': []},
             'ReadOnly': {'Users': [], 'Policies': [READ_ONLY_ARN]},
             'Powerusers': {'Users': [], 'Policies': []}
         }
 
+        now = self.now if self.now is not None else int(time.time())
         policies_in_use = {}
         for user in users:
             user_attached_managed_policies = copy.deepcopy(user['AttachedManagedPolicies'])
             for group_name in user['GroupList']:
-                group_managed_policies = next(g['AttachedManagedPolicies'] for g in account_groups if g['GroupName'] == group_name)
+                group_managed_policies = iam_data_index.groups_by_name[group_name]['AttachedManagedPolicies']
                 user_attached_managed_policies.extend(group_managed_policies)
             user_attached_managed_policies = list(set(map(lambda p: p['PolicyArn'], user_attached_managed_policies)))
             user_attached_managed_policies.sort()
             if ADMIN_POLICY_ARN in user_attached_managed_policies:
                 clusters['Admins']['Users'].append(user['UserName'])
             else:
-                services_in_use = list(
-                    map(
-                        lambda last_access: last_access['ServiceNamespace'],
-                        filter(
-                            lambda last_access: days_from_today(last_access['LastAccessed']) < self.unused_threshold,
-                            user['LastAccessed']
-                        )
-                    )
-                )
+                services, last_accessed_epochs = iam_data_index.get_last_accessed(user)
+                services_in_use = [service for service, days in zip(services, Dates.days_since(last_accessed_epochs, now))
+                                   if days < self.unused_threshold]
 
                 user_attached_managed_policies_in_use = []
                 for policy_arn in user_attached_managed_policies:
-                    policy_obj = next(p for p in account_policies if policy_arn == p['Arn'])
-                    policy_document = next(version for version in policy_obj['PolicyVersionList'] if version['IsDefaultVersion'])['Document']
-                    policy_in_use = not PolicyAnalyzer.is_policy_unused(policy_document, services_in_use)
+                    policy_obj = iam_data_index.policies_by_arn[policy_arn]
+                    policy_in_use = not self.policy_analysis_cache.get_analysis(policy_obj).is_unused(services_in_use)
                     if policy_in_use:
                         user_attached_managed_policies_in_use.append(policy_arn)
 
@@ -79,9 +80,8 @@ class UserOrganizer:
                     if pol not in policies_in_use:
                         policies_in_use[pol] = 0
                     policies_in_use[pol] += 1
-                    policy_obj = next(p for p in account_policies if p['Arn'] == pol)
-                    policy_document = next(version for version in policy_obj['PolicyVersionList'] if version['IsDefaultVersion'])['Document']
-                    if PolicyAnalyzer.policy_is_write_access(policy_document):
+                    policy_obj = iam_data_index.policies_by_arn[pol]
+                    if self.policy_analysis_cache.get_analysis(policy_obj).is_write_access():
                         user_needs_write_access = True
                         break
 
@@ -0,0 +1,134 @@
+import json
+import os
+import re
+import uuid
+
+from python_terraform import IsFlagged
+
+STATE_FILE_NAME = 'terraform.tfstate'
+STATE_VERSION = 4
+# The oldest Terraform version which reads version 4 states, so any newer Terraform accepts the state
+STATE_TERRAFORM_VERSION = '0.12.0'
+AWS_PROVIDER = 'provider["registry.terraform.io/hashicorp/aws"]'
+RESOURCE_DECLARATION = re.compile(r'resource\s+"?([\w-]+)"?\s+"([^"]+)"')
+VERIFICATION_PLAN_FILE_NAME = 'airiam-state-verification.tfplan'
+# A resource the plan would create, delete or replace (delete and create) doesn't match the state. Updates are expected - the code adds tags
+MISMATCH_PLAN_ACTIONS = frozenset(['create', 'delete'])
+
+
+class TerraformStateWriter:
+    """
+    Writes a Terraform state of the existing entities straight from the collected IAM data, instead of importing them one by one.
+    Each resource is stored under the address its transformer's identifier() produces, with only the attributes which identify it -
+    Terraform refreshes all other attributes from AWS on the next plan
+    """
+
+    def __init__(self, result_dir: str):
+        self._result_dir = result_dir
+        self.state_file = os.path.join(result_dir, STATE_FILE_NAME)
+
+    def write(self, entities_to_import: list) -> dict:
+        """
+        Writes the state of the entities. An existing state is kept as a backup, and its lineage is continued so Terraform treats the new
+        state as a newer revision of it
+        :param entities_to_import: The entities, as returned by the transformers' entities_to_import()
+        :return: The state that was written
+        """
+        existing_state = self.read()
+        state = {
+            'version': STATE_VERSION,
+            'terraform_version': existing_state.get('terraform_version', STATE_TERRAFORM_VERSION),
+            'serial': existing_state.get('serial', 0) + 1,
+            'lineage': existing_state.get('lineage', str(uuid.uuid4())),
+            'outputs': {},
+            'resources': TerraformStateWriter.to_resources(entities_to_import)
+        }
+        if os.path.exists(self.state_file):
+            os.replace(self.state_file, f'{self.state_file}.backup')
+        with open(self.state_file, 'w') as state_file:
+            json.dump(state, state_file, indent=2)
+        return state
+
+    def read(self) -> dict:
+        if not os.path.exists(self.state_file):
+            return {}
+        with open(self.state_file) as state_file:
+            return json.load(state_file)
+
+    def get_managed_addresses(self) -> set:
+        """
+        :return: The addresses of the resources which the existing state already manages
+        """
+        return {f'{resource["type"]}.{resource["name"]}' for resource in self.read().get('resources', [])
+                if resource.get('mode', 'managed') == 'managed' and 'module' not in resource}
+
+    @staticmethod
+    def to_resources(entities_to_import: list) -> list:
+        resources = {}
+        for entity_to_import in entities_to_import:
+            if entity_to_import['identifier'] in resources:
+                continue
+            resource_type, name = entity_to_import['identifier'].split('.', 1)
+            resources[entity_to_import['identifier']] = {
+                'mode': 'managed',
+                'type': resource_type,
+                'name': name,
+                'provider': AWS_PROVIDER,
+                'instances': [{
+                    'schema_version': 0,
+                    'attributes': {'id': entity_to_import['entity'], **entity_to_import.get('attributes', {})},
+                    'sensitive_attributes': []
+                }]
+            }
+        return [resources[identifier] for identifier in sorted(resources)]
+
+    def verify(self, tf) -> list:
+        """
+        Verifies the written state against the generated code: every resource in the state has to be declared in the code, and
+        `terraform plan -refresh=false` must not create, delete or replace any resource. The plan doesn't refresh the resources from AWS,
+        though the AWS provider is still configured, which calls AWS STS
+        :param tf: A python_terraform Terraform instance, initialized in the result dir
+        :return: The list of the problems that were found
+        """
+        declared_addresses = set()
+        for file_name in os.listdir(self._result_dir):
+            if file_name.endswith('.tf'):
+                with open(os.path.join(self._result_dir, file_name)) as code_file:
+                    declared_addresses.update(f'{resource_type}.{name}' for resource_type, name in RESOURCE_DECLARATION.findall(code_file.read()))
+        problems = [f'{address} is in the state but isn\'t declared in the code' for address in sorted(self.get_managed_addresses())
+                    if address not in declared_addresses]
+        if tf is not None:
+            problems += self._verify_plan(tf)
+        return problems
+
+    def _verify_plan(self, tf) -> list:
+        try:
+            # With -detailed-exitcode, 0 means no changes, 1 an error and 2 pending changes, which have to be inspected
+            return_code, stdout, stderr = tf.plan(refresh=False, input=False, lock=False, detailed_exitcode=IsFlagged,
+                                                  out=VERIFICATION_PLAN_FILE_NAME)
+            if return_code == 0:
+                return []
+            if return_code != 2:
+                return [f'terraform plan failed: {stderr}']
+            return_code, stdout, stderr = tf.cmd('show', VERIFICATION_PLAN_FILE_NAME, json=IsFlagged, no_color=IsFlagged)
+            if return_code != 0:
+                return [f'terraform show failed: {stderr}']
+            return TerraformStateWriter.find_plan_mismatches(json.loads(stdout))
+        finally:
+            plan_file = os.path.join(self._result_dir, VERIFICATION_PLAN_FILE_NAME)
+            if os.path.exists(plan_file):
+                os.remove(plan_file)
+
+    @staticmethod
+    def find_plan_mismatches(plan: dict) -> list:
+        """
+        :param plan: A plan, as printed by `terraform show -json`
+        :return: A problem for every resource the plan would create, delete or replace
+        """
+        problems = []
+        for resource_change in plan.get('resource_changes', []):
+            actions = set(resource_change['change']['actions'])
+            if actions & MISMATCH_PLAN_ACTIONS:
+                action = 'replace' if actions >= MISMATCH_PLAN_ACTIONS else next(iter(actions & MISMATCH_PLAN_ACTIONS))
+                problems.append(f'terraform plan would {action} {resource_change["address"]}')
+        return problems
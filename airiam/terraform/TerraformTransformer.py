@@ -1,7 +1,14 @@
 from python_terraform import *
+import collections
+import concurrent.futures
 import copy
+import itertools
+import json
 
+from airiam.config import MAX_PROCESSES
+from airiam.find_unused.IamDataCache import IamDataCache
 from airiam.models import RuntimeReport
+from airiam.terraform.TerraformStateWriter import TerraformStateWriter
 from airiam.terraform.entity_terraformers.AWSProviderTransformer import AWSProviderTransformer
 from airiam.terraform.entity_terraformers.IAMGroupTransformer import IAMGroupTransformer
 from airiam.terraform.entity_terraformers.IAMPolicyTransformer import IAMPolicyTransformer
@@ -12,6 +19,17 @@ from airiam.terraform.entity_terraformers.IAMUserTransformer import IAMUserTrans
 current_dir = os.path.abspath(os.path.dirname(__file__))
 boilerplate_files = ["admins.tf", "developers.tf", "power_users.tf"]
 ERASE_LINE = '\x1b[2K'
+IMPORTS_FILE_NAME = 'imports.tf'
+CODE_WRITE_BUFFER_SIZE = int(os.getenv("CODE_WRITE_BUFFER_SIZE", 1024 * 1024))
+# The number of entities a process transforms at a time
+CODE_GENERATION_CHUNK_SIZE = int(os.getenv("CODE_GENERATION_CHUNK_SIZE", 50))
+# The file of every entity type, and the key its entities are sorted by, so the code is generated in the same order on every run
+CODE_FILES = [('policies.tf', 'Policies', 'PolicyName'), ('groups.tf', 'Groups', 'GroupName'), ('users.tf', 'Users', 'UserName'),
+              ('roles.tf', 'Roles', 'RoleName')]
+ENTITY_TRANSFORMERS = {'Policies': IAMPolicyTransformer, 'Groups': IAMGroupTransformer, 'Roles': IAMRoleTransformer}
+# cli runs `terraform import` for every entity, blocks writes import blocks (Terraform 1.5+) which a single plan/apply imports at once,
+# and state writes the Terraform state of the entities straight from the collected data
+IMPORT_MODES = ['cli', 'blocks', 'state']
 
 
 class TerraformTransformer:
@@ -22,7 +40,7 @@ class TerraformTransformer:
         if not os.path.exists(self._result_dir):
             os.mkdir(self._result_dir)
 
-    def transform(self, results: RuntimeReport, without_unused: bool, without_groups: bool, without_import: bool) -> (dict, str):
+    def transform(self, results: RuntimeReport, without_unused: bool, without_groups: bool, without_import: bool, import_mode='cli') -> (dict, str):
         try:
             if not without_groups:
                 # todo: implement!
@@ -31,11 +49,30 @@ class TerraformTransformer:
                 self.logger.warning('Will use the existing groups for terraform migration until it is implemented')
             entities_to_transform = self._list_entities_to_transform(results, without_unused, without_groups)
             entities_to_import = self.write_terraform_code(entities_to_transform)
+            imports_file = f"{self._result_dir}/{IMPORTS_FILE_NAME}"
+            if os.path.exists(imports_file):
+                os.remove(imports_file)
+            if not without_import and import_mode != 'state':
+                entities_to_import = self._skip_managed_entities(entities_to_import)
+            if not without_import and import_mode == 'blocks':
+                self.write_import_blocks(entities_to_import)
             tf = Terraform(working_dir=self._result_dir)
             print("Initializing terraform")
             tf.init(backend=False)
             tf.fmt()
-            if not without_import:
+            if not without_import and import_mode == 'blocks':
+                print(f"Wrote {len(entities_to_import)} import blocks to {imports_file}. Run `terraform apply` in {self._result_dir} to import "
+                      f"all the existing entities at once")
+            elif not without_import and import_mode == 'state':
+                state_writer = TerraformStateWriter(self._result_dir)
+                state = state_writer.write(entities_to_import)
+                print(f"Wrote the state of {len(state['resources'])} existing entities to {state_writer.state_file}, verifying it")
+                problems = state_writer.verify(tf)
+                for problem in problems:
+                    self.logger.error(problem)
+                if len(problems) == 0:
+                    print("Verified the state against the terraform code")
+            elif not without_import:
                 num_of_entities_to_import = len(entities_to_import)
                 print(f"Importing {num_of_entities_to_import} entities")
                 i = 1
@@ -53,6 +90,17 @@ class TerraformTransformer:
             self.logger.error(e, stack_info=True)
             raise e
 
+    def _skip_managed_entities(self, entities_to_import: list) -> list:
+        """
+        :return: The entities which the existing state in the result dir doesn't manage yet, so reruns only import the new entities
+        """
+        managed_addresses = TerraformStateWriter(self._result_dir).get_managed_addresses()
+        if len(managed_addresses) == 0:
+            return entities_to_import
+        new_entities = [entity_to_import for entity_to_import in entities_to_import if entity_to_import['identifier'] not in managed_addresses]
+        print(f"Skipping {len(entities_to_import) - len(new_entities)} entities which are already in the terraform state")
+        return new_entities
+
     def _list_entities_to_transform(self, report: RuntimeReport, without_unused: bool, without_consolidated_groups: bool) -> dict:
         iam_raw_data = report.get_raw_data()
         raw_entities_to_transform = {
@@ -110,57 +158,99 @@ class TerraformTransformer:
             principal[f'{principal_type}PolicyList'].remove(policy_attachment)
 
     def write_terraform_code(self, iam_entities: dict) -> list:
+        """
+        Generates the code of the entities in up to MAX_PROCESSES processes, each transforming a chunk of entities of one type at a time.
+        The entities are sorted, and the chunks are written in order, so the same entities always result in the same files
+        :return: The entities to import, in the order of their code
+        """
         entities_to_import = []
-        with open(f"{self._result_dir}/main.tf", 'w') as main_file:
-            main_code = AWSProviderTransformer({'region': 'us-east-1', 'profile': self.profile}).code()
-            main_file.write(main_code)
-
-        policies_identifiers = {}
-
-        with open(f"{self._result_dir}/policies.tf", 'w') as policies_file:
-            policy_code = ""
-            for policy in iam_entities['Policies']:
-                if 'iam::aws:' in policy['Arn']:
-                    # Don't create AWS managed policies
-                    continue
-                policy_transformer = IAMPolicyTransformer(policy)
-                policy_code += policy_transformer.code()
-                policies_identifiers[policy['Arn']] = policy_transformer.identifier()
-                entities_to_import += policy_transformer.entities_to_import()
-            policies_file.write(policy_code)
-
-        with open(f"{self._result_dir}/groups.tf", 'w') as groups_file:
-            groups_code = ""
-            groups_identifiers = {}
-            for group in iam_entities['Groups']:
-                group_transformer = IAMGroupTransformer(group)
-                groups_code += group_transformer.code()
-                groups_identifiers[group['GroupName']] = group_transformer.identifier()
-                entities_to_import += group_transformer.entities_to_import()
-            groups_file.write(groups_code)
-
-        user_group_memberships = {}
-        with open(f"{self._result_dir}/users.tf", 'w') as users_file:
-            user_code = ""
-            for user in iam_entities['Users']:
-                transformer = IAMUserTransformer(user)
-                user_code += transformer.code()
-                for group in user['GroupList']:
-                    if group not in user_group_memberships:
-                        user_group_memberships[group] = []
-                    user_group_memberships[group].append(user['UserName'])
-                membership_transformer = IAMUserGroupMembershipTransformer({"UserName": user['UserName'], "Groups": user['GroupList']},
-                                                                           transformer.identifier())
-                user_code += membership_transformer.code()
-                entities_to_import += transformer.entities_to_import() + membership_transformer.entities_to_import()
-            users_file.write(user_code)
-
-        with open(f"{self._result_dir}/roles.tf", 'w') as roles_file:
-            roles_code = ""
-            for role in iam_entities['Roles']:
-                transformer = IAMRoleTransformer(role)
-                roles_code += transformer.code()
-                entities_to_import += transformer.entities_to_import()
-            roles_file.write(roles_code)
-
+        provider_code = AWSProviderTransformer({'region': 'us-east-1', 'profile': self.profile}).code()
+        self._write_code_file("main.tf", [(provider_code, [])], entities_to_import)
+        # Don't create AWS managed policies
+        iam_entities = {**iam_entities, 'Policies': [policy for policy in iam_entities['Policies'] if 'iam::aws:' not in policy['Arn']]}
+        chunks = {}
+        for file_name, entity_type, sort_key in CODE_FILES:
+            entities = sorted(iam_entities[entity_type], key=lambda entity: entity[sort_key])
+            chunks[file_name] = [(entity_type, entities[i:i + CODE_GENERATION_CHUNK_SIZE])
+                                 for i in range(0, len(entities), CODE_GENERATION_CHUNK_SIZE)]
+        all_chunks = [chunk for file_name, _, _ in CODE_FILES for chunk in chunks[file_name]]
+        if MAX_PROCESSES <= 1 or len(all_chunks) <= 1:
+            transformed_chunks = (TerraformTransformer._transform_chunk(entity_type, entities) for entity_type, entities in all_chunks)
+            self._write_code_files(chunks, transformed_chunks, entities_to_import)
+            return entities_to_import
+        # Forking while the local cache is written on a background thread could deadlock the workers
+        IamDataCache.wait_for_pending_writes()
+        with concurrent.futures.ProcessPoolExecutor(max_workers=min(MAX_PROCESSES, len(all_chunks))) as executor:
+            self._write_code_files(chunks, TerraformTransformer._transform_in_order(executor, all_chunks), entities_to_import)
         return entities_to_import
+
+    def _write_code_files(self, chunks: dict, transformed_chunks, entities_to_import: list) -> None:
+        """
+        :param chunks:             The chunks of every file
+        :param transformed_chunks: The code and entities to import of the chunks of all the files, in the order of the files
+        """
+        transformed_chunks = iter(transformed_chunks)
+        for file_name, _, _ in CODE_FILES:
+            self._write_code_file(file_name, itertools.islice(transformed_chunks, len(chunks[file_name])), entities_to_import)
+
+    @staticmethod
+    def _transform_in_order(executor, chunks: list):
+        """
+        Yields the transformed chunks in order, while up to 2 * MAX_PROCESSES of the following chunks are transformed. Chunks are submitted
+        only as earlier ones are consumed, so only a bounded number of transformed chunks is held in memory
+        """
+        pending = collections.deque()
+        for entity_type, entities in chunks:
+            pending.append(executor.submit(TerraformTransformer._transform_chunk, entity_type, entities))
+            if len(pending) >= 2 * MAX_PROCESSES:
+                yield pending.popleft().result()
+        while len(pending) > 0:
+            yield pending.popleft().result()
+
+    def _write_code_file(self, file_name: str, transformed_chunks, entities_to_import: list) -> None:
+        """
+        Writes the code of every chunk of entities to the file as soon as it is generated, through a buffered writer, so the code of the
+        whole file is never held in memory
+        :param transformed_chunks: The code and entities to import of every chunk, usually an iterator which generates them one at a time
+        :param entities_to_import: The list to which the chunks' entities to import are added
+        """
+        with open(f"{self._result_dir}/{file_name}", 'w', buffering=CODE_WRITE_BUFFER_SIZE) as code_file:
+            for code, chunk_entities_to_import in transformed_chunks:
+                code_file.write(code)
+                entities_to_import.extend(chunk_entities_to_import)
+
+    @staticmethod
+    def _transform_chunk(entity_type: str, entities: list) -> (str, list):
+        """
+        :return: The code and the entities to import of a chunk of entities of one type
+        """
+        if entity_type == 'Users':
+            transformers = TerraformTransformer._user_transformers(entities)
+        else:
+            transformers = (ENTITY_TRANSFORMERS[entity_type](entity) for entity in entities)
+        code_chunks = []
+        entities_to_import = []
+        for transformer in transformers:
+            code_chunks.extend(transformer.code_chunks())
+            entities_to_import.extend(transformer.entities_to_import())
+        return ''.join(code_chunks), entities_to_import
+
+    @staticmethod
+    def _user_transformers(users: list):
+        for user in users:
+            transformer = IAMUserTransformer(user)
+            yield transformer
+            yield IAMUserGroupMembershipTransformer({"UserName": user['UserName'], "Groups": user['GroupList']}, transformer.identifier())
+
+    def write_import_blocks(self, entities_to_import: list) -> None:
+        """
+        Writes an import block for every entity, so Terraform imports all of them in a single plan/apply instead of a process per entity
+        """
+        with open(f"{self._result_dir}/{IMPORTS_FILE_NAME}", 'w') as imports_file:
+            for entity_to_import in entities_to_import:
+                imports_file.write(f"""import {{
+  to = {entity_to_import['identifier']}
+  id = {json.dumps(entity_to_import['entity'])}
+}}
+
+""")
@@ -12,16 +12,33 @@ class BaseEntityTransformer:
         self._entity_type = entity_type
         self._entity_name = entity_name
         self._safe_name = BaseEntityTransformer.safe_name_converter(entity_name)
-        self._code = self._generate_hcl2_code(entity_json)
+        self._state_attributes = self._generate_state_attributes(entity_json)
+        self._code_chunks = list(self._generate_hcl2_code_chunks(entity_json))
 
     def _generate_hcl2_code(self, entity_json) -> str:
         raise NotImplementedError()
 
+    def _generate_hcl2_code_chunks(self, entity_json):
+        """
+        Yields the entity's code in chunks. Transformers which include the code of other transformers override it to yield their chunks as
+        they are, instead of concatenating them
+        """
+        yield self._generate_hcl2_code(entity_json)
+
+    def _generate_state_attributes(self, entity_json) -> dict:
+        """
+        :return: The attributes which identify the entity's resource in a Terraform state. Terraform refreshes all other attributes from AWS
+        """
+        return {}
+
     def entities_to_import(self) -> list:
-        return [{"identifier": self.identifier(), "entity": self._entity_name}]
+        return [{"identifier": self.identifier(), "entity": self._entity_name, "attributes": self._state_attributes}]
 
     def code(self) -> str:
-        return self._code
+        return ''.join(self._code_chunks)
+
+    def code_chunks(self):
+        return iter(self._code_chunks)
 
     def identifier(self) -> str:
         return f"{self._entity_type}.{self._safe_name}"
@@ -8,29 +8,35 @@ class IAMGroupTransformer(BaseEntityTransformer):
         self._sub_entities_to_import = []
         super().__init__('aws_iam_group', BaseEntityTransformer.safe_name_converter(entity_json['GroupName']), entity_json)
 
-    def _generate_hcl2_code(self, entity_json) -> str:
-        group_policies = ""
-        managed_policies = ""
+    def _generate_hcl2_code_chunks(self, entity_json):
+        tags = BaseEntityTransformer.transform_tags(entity_json)
+        yield f"""resource "aws_iam_group" "{self._safe_name}" {{
+  name = "{entity_json['GroupName']}"
+  path = "{entity_json['Path']}"
+}}
+
+"""
 
         for inline_policy in entity_json.get('UserPolicyList', []):
             transformer = IAMInlinePolicyTransformer(inline_policy, self._safe_name, Principal.Group)
-            group_policies += transformer.code()
+            yield from transformer.code_chunks()
             self._sub_entities_to_import += transformer.entities_to_import()
+        yield "\n"
 
         for managed_policy in entity_json.get('AttachedManagedPolicies', []):
             transformer = IAMManagedPolicyAttachmentTransformer(managed_policy, self._safe_name, Principal.Group)
-            managed_policies += transformer.code()
+            yield from transformer.code_chunks()
             self._sub_entities_to_import += transformer.entities_to_import()
-
-        tags = BaseEntityTransformer.transform_tags(entity_json)
-        return f"""resource "aws_iam_group" "{self._safe_name}" {{
-  name = "{entity_json['GroupName']}"
-  path = "{entity_json['Path']}"
-}}
-
-{group_policies}
-{managed_policies}
-"""
+        yield "\n"
+
+    def _generate_state_attributes(self, entity_json) -> dict:
+        return {
+            'id': entity_json['GroupName'],
+            'name': entity_json['GroupName'],
+            'path': entity_json['Path'],
+            'arn': entity_json['Arn'],
+            'unique_id': entity_json['GroupId']
+        }
 
     def entities_to_import(self) -> list:
         return super().entities_to_import() + self._sub_entities_to_import
@@ -10,16 +10,25 @@ class IAMInlinePolicyTransformer(BaseEntityTransformer):
         self._principal = principal.value
         super().__init__(f"aws_iam_{principal.value}_policy", policy_name, entity_json)
 
-    def _generate_hcl2_code(self, entity_json) -> str:
+    def _generate_hcl2_code_chunks(self, entity_json):
         policy_document_hcl = IAMPolicyDocumentTransformer(entity_json['PolicyDocument'], f"{self._safe_name}_document", self.principal_name)
-        return f"""resource "aws_iam_{self._principal}_policy" "{self.principal_name}_{self._safe_name}" {{
+        yield f"""resource "aws_iam_{self._principal}_policy" "{self.principal_name}_{self._safe_name}" {{
   name   = "{entity_json['PolicyName']}"
   policy = {policy_document_hcl.identifier()}.json
   {self._principal}   = aws_iam_{self._principal}.{self._safe_user_name}.name
 }}
 
-{policy_document_hcl.code()}
 """
+        yield from policy_document_hcl.code_chunks()
+        yield "\n"
+
+    def _generate_state_attributes(self, entity_json) -> dict:
+        return {
+            'id': f"{self.principal_name}:{entity_json['PolicyName']}",
+            'name': entity_json['PolicyName'],
+            self._principal: self.principal_name
+        }
 
     def entities_to_import(self) -> list:
-        return [{"identifier": f"aws_iam_{self._principal}_policy.{self.principal_name}_{self._safe_name}", "entity": f"{self.principal_name}:{self._entity_name}"}]
+        return [{"identifier": f"aws_iam_{self._principal}_policy.{self.principal_name}_{self._safe_name}", "entity": f"{self.principal_name}:{self._entity_name}",
+                 "attributes": self._state_attributes}]
@@ -23,8 +23,15 @@ class IAMManagedPolicyAttachmentTransformer(BaseEntityTransformer):
 }}
 """
 
+    def _generate_state_attributes(self, entity_json) -> dict:
+        return {
+            'id': f"{self._user_name}/{self._policy_arn}",
+            'policy_arn': self._policy_arn,
+            self._principal: self._user_name
+        }
+
     def entities_to_import(self) -> list:
-        return [{"identifier": self.identifier(), "entity": f"{self._user_name}/{self._policy_arn}"}]
+        return [{"identifier": self.identifier(), "entity": f"{self._user_name}/{self._policy_arn}", "attributes": self._state_attributes}]
 
     @staticmethod
     def is_aws_managed(policy_arn):
@@ -10,20 +10,19 @@ class IAMPolicyDocumentTransformer(BaseEntityTransformer):
             policy_document_name = f"{principal_name}_{policy_document_name}"
         super().__init__('data.aws_iam_policy_document', policy_document_name, entity_json)
 
-    def _generate_hcl2_code(self, entity_json) -> str:
+    def _generate_hcl2_code_chunks(self, entity_json):
         statements = IAMPolicyDocumentTransformer.force_list(entity_json['Statement'])
+        yield f"""data "aws_iam_policy_document" "{self._safe_name}" {{
+  version = "{entity_json.get('Version', '2012-10-17')}"
+"""
         if 'Principal' in statements[0]:
-            statements = self.transform_assume_policy_statements(statements)
+            yield from self.transform_assume_policy_statements(statements)
         else:
-            statements = self.transform_execution_policy(statements)
-        code = f"""data "aws_iam_policy_document" "{self._safe_name}" {{
-  version = "{entity_json.get('Version', '2012-10-17')}"
-{statements}}}"""
-        return code
+            yield from self.transform_execution_policy(statements)
+        yield "}"
 
     @staticmethod
     def transform_execution_policy(statements):
-        statement_block = ""
         for statement in statements:
             sid_string = ""
             if statement.get('Sid', '') != '':
@@ -37,7 +36,7 @@ class IAMPolicyDocumentTransformer(BaseEntityTransformer):
                 action_str = f"not_actions = {json.dumps(actions)}"
             condition_block = IAMPolicyDocumentTransformer.transform_conditions(statement)
             resources_list_str = json.dumps(IAMPolicyDocumentTransformer.force_list(statement.get('Resource'))).replace('${', '$\\u0024{')
-            statement_block += f"""  statement {{
+            yield f"""  statement {{
     {sid_string}effect    = "{statement['Effect']}"
     {action_str}
     resources = {resources_list_str}
@@ -45,18 +44,15 @@ class IAMPolicyDocumentTransformer(BaseEntityTransformer):
   }}
 """
 
-        return statement_block
-
     @staticmethod
     def transform_assume_policy_statements(statements):
-        statement_block = ""
         for statement in statements:
             sid_string = ""
             if statement.get('Sid', '') != '':
                 sid_string = f"sid    = \"{statement['Sid']}\"\n    "
             condition_block = IAMPolicyDocumentTransformer.transform_conditions(statement)
 
-            statement_block += f"""  statement {{
+            yield f"""  statement {{
     {sid_string}effect  = "{statement['Effect']}"
     actions = {json.dumps(IAMPolicyDocumentTransformer.force_list(statement['Action']))}
     principals {{
@@ -66,23 +62,21 @@ class IAMPolicyDocumentTransformer(BaseEntityTransformer):
   {condition_block}}}
 """
 
-        return statement_block
-
     @staticmethod
     def transform_conditions(statement):
-        condition_block = ""
+        condition_blocks = []
         if 'Condition' in statement:
             for test, items in statement['Condition'].items():
                 for variable, values in items.items():
                     values_str = json.dumps(IAMPolicyDocumentTransformer.force_list(values)).replace('${', '$\\u0024{')
-                    condition_block += f"""
+                    condition_blocks.append(f"""
     condition {{
       test     = "{test}"
       variable = "{variable}"
       values   = {values_str}
     }}
-  """
-        return condition_block
+  """)
+        return ''.join(condition_blocks)
 
     @staticmethod
     def force_list(x):
@@ -7,11 +7,12 @@ class IAMPolicyTransformer(BaseEntityTransformer):
         super().__init__('aws_iam_policy', entity_json['PolicyName'], entity_json)
         self._policy_arn = entity_json['Arn']
 
-    def _generate_hcl2_code(self, entity_json) -> str:
+    def _generate_hcl2_code_chunks(self, entity_json):
         document = next(version['Document'] for version in entity_json['PolicyVersionList'] if version['IsDefaultVersion'])
         policy = IAMPolicyDocumentTransformer(document, self._safe_name)
         tags = BaseEntityTransformer.transform_tags(entity_json)
-        policy_code = f"""{policy.code()}
+        yield from policy.code_chunks()
+        yield f"""
 
 resource "aws_iam_policy" "{self._safe_name}" {{
   name        = "{entity_json['PolicyName']}"
@@ -21,7 +22,15 @@ resource "aws_iam_policy" "{self._safe_name}" {{
 }}
 
 """
-        return policy_code
+
+    def _generate_state_attributes(self, entity_json) -> dict:
+        return {
+            'id': entity_json['Arn'],
+            'arn': entity_json['Arn'],
+            'name': entity_json['PolicyName'],
+            'path': entity_json['Path'],
+            'policy_id': entity_json['PolicyId']
+        }
 
     def entities_to_import(self) -> list:
-        return [{"identifier": self.identifier(), "entity": self._policy_arn}]
+        return [{"identifier": self.identifier(), "entity": self._policy_arn, "attributes": self._state_attributes}]
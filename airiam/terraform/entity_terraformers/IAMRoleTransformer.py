@@ -10,29 +10,14 @@ class IAMRoleTransformer(BaseEntityTransformer):
         self._sub_entities_to_import = []
         super().__init__('aws_iam_role', BaseEntityTransformer.safe_name_converter(entity_json['RoleName']), entity_json)
 
-    def _generate_hcl2_code(self, entity_json) -> str:
+    def _generate_hcl2_code_chunks(self, entity_json):
         assume_policy_document = IAMPolicyDocumentTransformer(entity_json['AssumeRolePolicyDocument'], f"{self._safe_name}_assume_role_policy")
-        role_policies = ""
-        for role_policy in entity_json['RolePolicyList']:
-            transformer = IAMInlinePolicyTransformer(role_policy, self._safe_name, Principal.Role)
-            role_policies += transformer.code()
-            self._sub_entities_to_import += transformer.entities_to_import()
-        for policy_attachment in entity_json['AttachedManagedPolicies']:
-            transformer = IAMManagedPolicyAttachmentTransformer(policy_attachment, self._safe_name, Principal.Role)
-            role_policies += transformer.code()
-            self._sub_entities_to_import += transformer.entities_to_import()
-        instance_profiles = ""
-        for instance_profile in entity_json['InstanceProfileList']:
-            transformer = InstanceProfileTransformer(instance_profile, self.identifier())
-            instance_profiles += transformer.code()
-            self._sub_entities_to_import += transformer.entities_to_import()
-
         tags = self.transform_tags(entity_json)
         permissions_boundary = ''
         if 'PermissionsBoundary' in entity_json:
             permissions_boundary = f'permissions_boundary = "{entity_json["PermissionsBoundary"]["PermissionsBoundaryArn"]}"'
 
-        return f"""resource "aws_iam_role" "{self._safe_name}" {{
+        yield f"""resource "aws_iam_role" "{self._safe_name}" {{
   name                  = "{entity_json['RoleName']}"
   path                  = "{entity_json['Path']}"
   description           = \"{entity_json['Description']}\"
@@ -42,10 +27,31 @@ class IAMRoleTransformer(BaseEntityTransformer):
   {tags}
 }}
 
-{assume_policy_document.code()}
+"""
+        yield from assume_policy_document.code_chunks()
+        yield "\n\n"
+        for role_policy in entity_json['RolePolicyList']:
+            transformer = IAMInlinePolicyTransformer(role_policy, self._safe_name, Principal.Role)
+            yield from transformer.code_chunks()
+            self._sub_entities_to_import += transformer.entities_to_import()
+        for policy_attachment in entity_json['AttachedManagedPolicies']:
+            transformer = IAMManagedPolicyAttachmentTransformer(policy_attachment, self._safe_name, Principal.Role)
+            yield from transformer.code_chunks()
+            self._sub_entities_to_import += transformer.entities_to_import()
+        yield "\n"
+        for instance_profile in entity_json['InstanceProfileList']:
+            transformer = InstanceProfileTransformer(instance_profile, self.identifier())
+            yield from transformer.code_chunks()
+            self._sub_entities_to_import += transformer.entities_to_import()
 
-{role_policies}
-{instance_profiles}"""
+    def _generate_state_attributes(self, entity_json) -> dict:
+        return {
+            'id': entity_json['RoleName'],
+            'name': entity_json['RoleName'],
+            'path': entity_json['Path'],
+            'arn': entity_json['Arn'],
+            'unique_id': entity_json['RoleId']
+        }
 
     def entities_to_import(self) -> list:
         return super().entities_to_import() + self._sub_entities_to_import
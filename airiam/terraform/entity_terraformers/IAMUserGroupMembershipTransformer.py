@@ -18,5 +18,12 @@ class IAMUserGroupMembershipTransformer(BaseEntityTransformer):
 }}
 """
 
+    def _generate_state_attributes(self, entity_json) -> dict:
+        return {
+            'id': f"{entity_json['UserName']}/{'/'.join(entity_json['Groups'])}",
+            'user': entity_json['UserName'],
+            'groups': entity_json['Groups']
+        }
+
     def entities_to_import(self) -> list:
-        return [{"identifier": self.identifier(), "entity": f"{self._user_name}/{'/'.join(self._groups)}"}]
+        return [{"identifier": self.identifier(), "entity": f"{self._user_name}/{'/'.join(self._groups)}", "attributes": self._state_attributes}]
@@ -8,29 +8,36 @@ class IAMUserTransformer(BaseEntityTransformer):
         self.sub_entities_to_import = []
         super().__init__('aws_iam_user', entity_json['UserName'], entity_json)
 
-    def _generate_hcl2_code(self, entity_json) -> str:
-        user_policies_code = ""
-        managed_policies_code = ""
+    def _generate_hcl2_code_chunks(self, entity_json):
+        tags = BaseEntityTransformer.transform_tags(entity_json)
+        yield f"""resource "aws_iam_user" "{self._safe_name}" {{
+  name          = "{entity_json['UserName']}"
+  path          = "{entity_json['Path']}"
+  force_destroy = true
+  
+  {tags}
+}}
+"""
 
         for inline_policy in entity_json.get('UserPolicyList', []):
             inline_policy_obj = IAMInlinePolicyTransformer(inline_policy, self._safe_name, Principal.User)
-            user_policies_code += inline_policy_obj.code()
+            yield from inline_policy_obj.code_chunks()
             self.sub_entities_to_import += inline_policy_obj.entities_to_import()
 
         for managed_policy in entity_json.get('AttachedManagedPolicies', []):
             managed_policy_obj = IAMManagedPolicyAttachmentTransformer(managed_policy, self._entity_name, Principal.User)
-            managed_policies_code += managed_policy_obj.code()
+            yield from managed_policy_obj.code_chunks()
             self.sub_entities_to_import += managed_policy_obj.entities_to_import()
 
-        tags = BaseEntityTransformer.transform_tags(entity_json)
-        return f"""resource "aws_iam_user" "{self._safe_name}" {{
-  name          = "{entity_json['UserName']}"
-  path          = "{entity_json['Path']}"
-  force_destroy = true
-  
-  {tags}
-}}
-{user_policies_code}{managed_policies_code}"""
+    def _generate_state_attributes(self, entity_json) -> dict:
+        return {
+            'id': entity_json['UserName'],
+            'name': entity_json['UserName'],
+            'path': entity_json['Path'],
+            'arn': entity_json['Arn'],
+            'unique_id': entity_json['UserId'],
+            'force_destroy': True
+        }
 
     def entities_to_import(self) -> list:
         return super().entities_to_import() + self.sub_entities_to_import
@@ -7,6 +7,15 @@ class InstanceProfileTransformer(BaseEntityTransformer):
         self._role_identifier = role_identifier
         super().__init__('aws_iam_instance_profile', BaseEntityTransformer.safe_name_converter(self.raw_name), entity_json)
 
+    def _generate_state_attributes(self, entity_json) -> dict:
+        return {
+            'id': self.raw_name,
+            'name': self.raw_name,
+            'path': entity_json['Path'],
+            'arn': entity_json['Arn'],
+            'unique_id': entity_json['InstanceProfileId']
+        }
+
     def _generate_hcl2_code(self, entity_json) -> str:
         tags = self.transform_tags(entity_json)
 
@@ -47,6 +47,7 @@ setup(
     author_email="meet@bridgecrew.io",
     url="https://github.com/bridgecrewio/AirIAM",
     packages=setuptools.find_packages(exclude=["tests*"]),
+    package_data={"airiam.find_unused": ["data/*.json.gz"]},
     scripts=["bin/airiam","bin/airiam.cmd"],
     long_description=long_description,
     long_description_content_type="text/markdown",
@@ -0,0 +1,107 @@
+import json
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import boto3
+from moto import mock_iam, mock_sts
+
+from airiam.find_unused.Dates import Dates, NO_DATE
+from airiam.find_unused.RuntimeIamScanner import RuntimeIamScanner
+from airiam.find_unused.find_unused import find_unused_users, find_unused_active_credentials, filter_credentials_of_unused_users, \
+    find_redundant_groups, find_unused_in_accounts, find_unused_roles, days_from_today
+from airiam.main import configure_logger
+from airiam.models.RuntimeReport import RuntimeReport
+
+
+class TestFindUnused(unittest.TestCase):
+    def setUp(self):
+        current_dir = os.path.abspath(os.path.dirname(__file__))
+        with open(f"{current_dir}/../iam_data.json") as f:
+            self.iam_data = json.load(f)
+        self.report = RuntimeReport('000000000000', 'arn:aws:iam::000000000000:user/testuser', self.iam_data)
+
+    def test_iam_data_index(self):
+        index = self.report.get_index()
+        self.assertIs(index, self.report.get_index())
+        self.assertEqual(len(index.users_by_name), len(self.iam_data['AccountUsers']))
+        self.assertEqual(len(index.policies_by_arn), len(self.iam_data['AccountPolicies']))
+        for user in self.iam_data['AccountUsers']:
+            self.assertIs(index.users_by_name[user['UserName']], user)
+
+    def test_indexed_lookups_match_unindexed(self):
+        users = self.iam_data['AccountUsers']
+        credential_report = self.iam_data['CredentialReport']
+        index = self.report.get_index()
+        unused_users, used_users = find_unused_users(users, credential_report, 90, index)
+        self.assertListEqual([u['UserName'] for u in unused_users],
+                             [u['UserName'] for u in find_unused_users(users, credential_report, 90)[0]])
+        access_keys, console_logins = find_unused_active_credentials(users, credential_report, 90, index)
+        self.assertEqual((access_keys, console_logins), find_unused_active_credentials(users, credential_report, 90))
+
+        filtered_access_keys, filtered_console_logins = filter_credentials_of_unused_users(access_keys, console_logins, unused_users)
+        unused_user_names = [u['UserName'] for u in unused_users]
+        for credential in filtered_access_keys + filtered_console_logins:
+            self.assertNotIn(credential['User'], unused_user_names)
+
+    def test_find_redundant_groups(self):
+        groups = [
+            {'GroupName': 'admins', 'AttachedManagedPolicies': [{'PolicyArn': 'arn:aws:iam::aws:policy/AdministratorAccess'}], 'GroupPolicyList': []},
+            {'GroupName': 'empty', 'AttachedManagedPolicies': [{'PolicyArn': 'arn:aws:iam::aws:policy/ReadOnlyAccess'}], 'GroupPolicyList': []},
+            {'GroupName': 'no-privileges', 'AttachedManagedPolicies': [], 'GroupPolicyList': []}
+        ]
+        users = [{'UserName': 'user1', 'GroupList': ['admins', 'no-privileges']}, {'UserName': 'user2', 'GroupList': ['admins']}]
+        redundant_groups = find_redundant_groups(groups, users)
+        self.assertListEqual(sorted(g['GroupName'] for g in redundant_groups), ['empty', 'no-privileges'])
+        self.assertIs(next(g for g in redundant_groups if g['GroupName'] == 'empty'), groups[1])
+
+    def test_dates(self):
+        now = Dates.to_epoch('2020-03-21T11:41:00+00:00')
+        epochs = Dates.to_epochs(['2020-03-20 11:41:01+00:00', '2020-01-01T00:00:00+00:00', 'N/A', 'no_information', 'not_supported', None, now])
+        self.assertListEqual(list(epochs[2:6]), [NO_DATE] * 4)
+        self.assertListEqual(list(Dates.days_since(epochs, now)), [0, 80, -1, -1, -1, -1, 0])
+        self.assertEqual(days_from_today('2020-03-11T11:41:00+00:00', now), 10)
+
+    def test_find_unused_roles_against_fixed_time(self):
+        roles = self.iam_data['AccountRoles']
+        last_used = max(last_access['LastAccessed'] for role in roles for last_access in role.get('LastAccessed') or [])
+        now = Dates.to_epoch(last_used) + 30 * 24 * 60 * 60
+        unused_roles, used_roles = find_unused_roles(roles, 31, self.report.get_index(), now)
+        self.assertIn(30, [role['LastUsed'] for role in used_roles])
+        self.assertTrue(all(role['LastUsed'] == -1 or role['LastUsed'] >= 31 for role in unused_roles))
+        unindexed_unused_roles, _ = find_unused_roles(roles, 31, now=now)
+        self.assertListEqual([role['RoleName'] for role in unindexed_unused_roles], [role['RoleName'] for role in unused_roles])
+
+    @mock_iam
+    @mock_sts
+    def test_find_unused_in_accounts(self):
+        def add_last_accessed(_, __, account_principals):
+            for principal in account_principals:
+                principal['LastAccessed'] = []
+
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch.dict('os.environ', {"AWS_ACCESS_KEY_ID": "FAKE", "AWS_SECRET_ACCESS_KEY": "FAKE", "AWS_DEFAULT_REGION": "us-east-1",
+                                          "XDG_CACHE_HOME": temp_dir}), \
+                patch.object(RuntimeIamScanner, '_add_last_accessed', add_last_accessed):
+            os.chdir(temp_dir)
+            try:
+                role_arns = [f'arn:aws:iam::{account_id}:role/AirIAM' for account_id in ['111111111111', '222222222222']]
+                for i, role_arn in enumerate(role_arns):
+                    credentials = boto3.client('sts').assume_role(RoleArn=role_arn, RoleSessionName='setup')['Credentials']
+                    iam = boto3.client('iam', aws_access_key_id=credentials['AccessKeyId'], aws_secret_access_key=credentials['SecretAccessKey'],
+                                       aws_session_token=credentials['SessionToken'])
+                    iam.create_user(UserName=f'user{i}')
+                report = find_unused_in_accounts(configure_logger(), role_arns, None, True, 90, 'find_unused')
+            finally:
+                os.chdir(cwd)
+        self.assertListEqual(report.get_account_ids(), ['111111111111', '222222222222'])
+        unused_users = sorted((user['AccountId'], user['UserName']) for user in report.get_unused()['Users'])
+        self.assertListEqual(unused_users, [('111111111111', 'user0'), ('222222222222', 'user1')])
+        for account_report in report.get_reports():
+            self.assertDictEqual(account_report.get_raw_data(), {})
+
+
+if __name__ == '__main__':
+    unittest.main()
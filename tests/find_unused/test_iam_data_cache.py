@@ -0,0 +1,140 @@
+import gzip
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from unittest.mock import MagicMock, patch
+
+from airiam.find_unused.IamDataCache import IamDataCache, get_iam_data_file, get_manifest_file
+from airiam.find_unused.ManagedPolicyCatalog import ManagedPolicyCatalog
+from airiam.find_unused.RuntimeIamScanner import RuntimeIamScanner
+from airiam.version import version
+
+
+class TestIamDataCache(unittest.TestCase):
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.temp_dir = tempfile.TemporaryDirectory()
+        os.chdir(self.temp_dir.name)
+        self.iam_data = {
+            'CredentialReport': {},
+            'AccountUsers': [{'Arn': 'arn:aws:iam::000000000000:user/user1', 'LastAccessed': [], 'LastAccessedTime': 1000}],
+            'AccountRoles': [],
+            'AccountGroups': [],
+            'AccountPolicies': []
+        }
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.temp_dir.cleanup()
+
+    def test_manifest(self):
+        cache = IamDataCache('000000000000', 'dev')
+        self.assertFalse(cache.is_usable())
+        cache.save(self.iam_data)
+        manifest = cache.get_manifest()
+        self.assertEqual(manifest['Profile'], 'dev')
+        self.assertEqual(manifest['ToolVersion'], version)
+        self.assertEqual(manifest['Sections']['LastAccessed'], 1000)
+        self.assertSetEqual(set(manifest['Sections'].keys()), set(self.iam_data.keys()) | {'LastAccessed'})
+        self.assertDictEqual(cache.load(), self.iam_data)
+        self.assertFalse(IamDataCache('111111111111').is_usable())
+
+    def test_interrupted_write_leaves_no_manifest(self):
+        cache = IamDataCache('000000000000')
+        cache.save(self.iam_data)
+        with patch('airiam.find_unused.IamDataCache.json.dump', side_effect=OSError('No space left on device')):
+            with self.assertRaises(OSError):
+                cache.save(self.iam_data)
+        self.assertFalse(cache.is_usable())
+        self.assertListEqual([file_name for file_name in os.listdir(os.path.dirname(get_iam_data_file('000000000000')))
+                              if file_name.endswith('.tmp')], [])
+
+    def test_unreadable_cache_is_collected_again(self):
+        cache = IamDataCache('000000000000')
+        cache.save(self.iam_data)
+        with open(get_iam_data_file('000000000000'), 'r+b') as iam_data_file:
+            iam_data_file.truncate(10)
+        self.assertTrue(cache.is_usable())
+        scanner = RuntimeIamScanner(MagicMock())
+        scanner._session = MagicMock()
+        with patch.object(scanner, '_collect_iam_data', return_value=self.iam_data) as collect_mock:
+            self.assertDictEqual(scanner._get_data_from_aws('000000000000', False), self.iam_data)
+        collect_mock.assert_called_once()
+        IamDataCache.wait_for_pending_writes()
+        self.assertDictEqual(cache.load(), self.iam_data)
+
+    def test_max_cache_age(self):
+        del self.iam_data['AccountUsers'][0]['LastAccessedTime']
+        cache = IamDataCache('000000000000')
+        cache.save(self.iam_data)
+        self.assertTrue(cache.is_usable(max_age=60))
+        manifest = cache.get_manifest()
+        manifest['Sections']['AccountUsers'] = int(time.time()) - 2 * 60 * 60
+        with open(get_manifest_file('000000000000'), 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+        self.assertFalse(cache.is_usable(max_age=60 * 60))
+        self.assertTrue(cache.is_usable())
+
+    def test_unknown_schema_version(self):
+        cache = IamDataCache('000000000000')
+        cache.save(self.iam_data)
+        manifest = cache.get_manifest()
+        manifest['SchemaVersion'] = 0
+        with open(get_manifest_file('000000000000'), 'w') as manifest_file:
+            json.dump(manifest, manifest_file)
+        self.assertFalse(cache.is_usable())
+
+    def test_policy_documents_are_deduplicated(self):
+        document = {'Version': '2012-10-17', 'Statement': [{'Effect': 'Allow', 'Action': 's3:GetObject', 'Resource': '*'}]}
+        self.iam_data['AccountPolicies'] = [
+            {'Arn': f'arn:aws:iam::000000000000:policy/policy{i}',
+             'PolicyVersionList': [{'VersionId': 'v1', 'IsDefaultVersion': True, 'Document': json.loads(json.dumps(document))}]}
+            for i in range(5)
+        ]
+        self.iam_data['AccountRoles'] = [{'RoleName': 'role', 'AssumeRolePolicyDocument': {'Statement': []},
+                                          'RolePolicyList': [{'PolicyName': 'inline', 'PolicyDocument': json.loads(json.dumps(document))}]}]
+        cache = IamDataCache('000000000000')
+        cache.save(self.iam_data)
+        with gzip.open(get_iam_data_file('000000000000'), 'rt') as iam_data_file:
+            cached_data = json.load(iam_data_file)
+        self.assertEqual(len(cached_data['PolicyDocuments']), 2)
+        self.assertDictEqual(cache.load(), self.iam_data)
+
+    def test_save_in_background(self):
+        document = {'Version': '2012-10-17', 'Statement': [{'Effect': 'Allow', 'Action': 's3:*', 'Resource': '*'}]}
+        self.iam_data['AccountRoles'] = [{'Arn': 'arn:aws:iam::000000000000:role/role1', 'AssumeRolePolicyDocument': document}]
+        cache = IamDataCache('000000000000')
+        packing_threads = []
+        pack = cache._pack
+        with patch.object(cache, '_pack', side_effect=lambda iam_data: packing_threads.append(threading.current_thread()) or pack(iam_data)):
+            writer = cache.save_in_background(self.iam_data)
+            self.iam_data['AccountUsers'][0]['LastAccessed'].append({'ServiceNamespace': 's3'})
+            document['Statement'][0]['Action'] = 'iam:*'
+            self.assertTrue(cache.is_usable())
+        self.assertListEqual(packing_threads, [writer])
+        cached_data = cache.load()
+        self.assertListEqual(cached_data['AccountUsers'][0]['LastAccessed'], [])
+        self.assertEqual(cached_data['AccountRoles'][0]['AssumeRolePolicyDocument']['Statement'][0]['Action'], 's3:*')
+
+    def test_aws_managed_policies_are_stored_in_catalog(self):
+        document = {'Version': '2012-10-17', 'Statement': [{'Effect': 'Allow', 'Action': '*', 'Resource': '*'}]}
+        self.iam_data['AccountPolicies'] = [{'Arn': 'arn:aws:iam::aws:policy/AdministratorAccess', 'DefaultVersionId': 'v1',
+                                             'PolicyVersionList': [{'VersionId': 'v1', 'IsDefaultVersion': True, 'Document': document}]}]
+        catalog = ManagedPolicyCatalog(os.path.join(self.temp_dir.name, 'catalog'))
+        cache = IamDataCache('000000000000', managed_policy_catalog=catalog)
+        cache.save(self.iam_data)
+        with gzip.open(get_iam_data_file('000000000000'), 'rt') as iam_data_file:
+            cached_data = json.load(iam_data_file)
+        self.assertDictEqual(cached_data['PolicyDocuments'], {})
+        self.assertEqual(len(cache.get_manifest()['ManagedPolicyDocuments']), 1)
+        self.assertDictEqual(cache.load(), self.iam_data)
+
+        os.remove(catalog._get_document_path(cache.get_manifest()['ManagedPolicyDocuments'][0]))
+        self.assertFalse(cache.is_usable())
+
+
+if __name__ == '__main__':
+    unittest.main()
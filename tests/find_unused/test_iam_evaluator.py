@@ -1,19 +1,34 @@
+import asyncio
 import datetime
 import json
+import os
+import tempfile
+import time
 import unittest
-from unittest.mock import patch
+from unittest.mock import MagicMock, patch
 
 import boto3
 from moto import mock_iam
 
 from airiam.main import configure_logger
-from airiam.find_unused.RuntimeIamScanner import RuntimeIamScanner
+from airiam.find_unused.CredentialReport import CredentialReport
+from airiam.find_unused.IamDataCache import IamDataCache
+from airiam.find_unused.ManagedPolicyCatalog import ManagedPolicyCatalog
+from airiam.find_unused.RuntimeIamScanner import RuntimeIamScanner, LAST_ACCESSED_TTL
 
 ADMIN_POLICY_ARN = 'arn:aws:iam::aws:policy/AdministratorAccess'
 READ_ONLY_ARN = 'arn:aws:iam::aws:policy/ReadOnlyAccess'
 
 
 class TestRuntimeIamEvaluator(unittest.TestCase):
+    def setUp(self):
+        # Keeps the fake AWS managed policies of the mocked accounts out of the real managed policy catalog
+        self.catalog_dir = tempfile.TemporaryDirectory()
+        self.managed_policy_catalog = ManagedPolicyCatalog(self.catalog_dir.name)
+
+    def tearDown(self):
+        self.catalog_dir.cleanup()
+
     def test_simplify_service_access_result(self):
         service_last_access = [
             {
@@ -1035,22 +1050,209 @@ class TestRuntimeIamEvaluator(unittest.TestCase):
         self.assertListEqual(['name', 'type', 'last_access'], list(json_csv[0].keys()))
         self.assertListEqual(list(json_csv[0].keys()), list(json_csv[1].keys()))
 
+    def test_read_credential_report(self):
+        csv_content = b'user,arn,user_creation_time,password_enabled,password_last_used,access_key_1_last_used_date\n' \
+                      b'<root_account>,arn:aws:iam::000000000000:root,2019-03-21T09:00:10+00:00,not_supported,2019-09-01T12:06:43+00:00,N/A\n' \
+                      b'"shati,the cat",arn:aws:iam::000000000000:user/shati,2020-02-05T10:56:00+00:00,true,no_information,N/A\n'
+        credential_report = CredentialReport.read(csv_content)
+        self.assertListEqual(list(credential_report.keys()), ['<root_account>', 'shati,the cat'])
+        shati = credential_report['shati,the cat']
+        self.assertEqual(shati['user_creation_time'], int(datetime.datetime(2020, 2, 5, 10, 56, tzinfo=datetime.timezone.utc).timestamp()))
+        self.assertEqual(shati['password_last_used'], 'no_information')
+        self.assertNotIn('access_key_1_last_used_date', shati)
+        self.assertIs(CredentialReport.by_user(credential_report), credential_report)
+        self.assertDictEqual(CredentialReport.by_user(RuntimeIamScanner.convert_csv_to_json(csv_content.decode('utf-8'))), credential_report)
+
     @mock_iam
     def test_iam_calls(self):
-        with patch.dict('os.environ', {"AWS_ACCESS_KEY_ID": "FAKE", "AWS_SECRET_ACCESS_KEY": "FAKE"}):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as temp_dir, patch.dict('os.environ', {"AWS_ACCESS_KEY_ID": "FAKE", "AWS_SECRET_ACCESS_KEY": "FAKE"}):
+            os.chdir(temp_dir)
+            try:
+                client = boto3.client('iam')
+                self.create_user(client, 'test@bridgecrew.io')
+                self.create_role(client, 'bc-role', ADMIN_POLICY_ARN)
+                self.create_role(client, 'bc-role2', READ_ONLY_ARN)
+                client.create_group(GroupName='admins', Path='/')
+                client.attach_group_policy(GroupName='admins', PolicyArn=ADMIN_POLICY_ARN)
+                client.create_group(GroupName='read-only', Path='/')
+                client.attach_group_policy(GroupName='read-only', PolicyArn=READ_ONLY_ARN)
+                client.add_user_to_group(GroupName='admins', UserName='test@bridgecrew.io')
+                client.add_user_to_group(GroupName='read-only', UserName='test@bridgecrew.io')
+                logger = configure_logger()
+                scanner = RuntimeIamScanner(logger, managed_policy_catalog=self.managed_policy_catalog)
+                iam_data = scanner._get_data_from_aws("000000000000", False)
+                IamDataCache.wait_for_pending_writes()
+            finally:
+                os.chdir(cwd)
+        self.assertTrue(len(iam_data.keys()) == 5)
+
+    @mock_iam
+    def test_collected_data_is_cached_in_background(self):
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch.dict('os.environ', {"AWS_ACCESS_KEY_ID": "FAKE", "AWS_SECRET_ACCESS_KEY": "FAKE", "AWS_DEFAULT_REGION": "us-east-1"}):
+            os.chdir(temp_dir)
+            try:
+                client = boto3.client('iam')
+                self.create_user(client, 'test@bridgecrew.io')
+                self.create_role(client, 'bc-role', ADMIN_POLICY_ARN)
+                scanner = RuntimeIamScanner(configure_logger(), refresh_cache=True, managed_policy_catalog=self.managed_policy_catalog)
+                iam_data = scanner._get_data_from_aws("000000000000", False)
+                self.assertIsInstance(iam_data['AccountRoles'][0]['CreateDate'], str)
+                self.assertDictEqual(IamDataCache("000000000000", managed_policy_catalog=self.managed_policy_catalog).load(), iam_data)
+            finally:
+                os.chdir(cwd)
+
+    @mock_iam
+    def test_get_account_iam_configuration_descriptions(self):
+        with patch.dict('os.environ', {"AWS_ACCESS_KEY_ID": "FAKE", "AWS_SECRET_ACCESS_KEY": "FAKE", "AWS_DEFAULT_REGION": "us-east-1"}):
+            client = boto3.client('iam')
+            for i in range(10):
+                client.create_policy(PolicyName=f'policy-{i}', Description=f'Policy number {i}', PolicyDocument=json.dumps({
+                    "Version": "2012-10-17",
+                    "Statement": [{"Effect": "Allow", "Action": "s3:GetObject", "Resource": "*"}]
+                }))
+            self.create_role(client, 'bc-role', READ_ONLY_ARN)
+            client.update_role(RoleName='bc-role', Description='A role')
+            _, account_roles, _, account_policies = RuntimeIamScanner.get_account_iam_configuration(client, self.managed_policy_catalog)
+        customer_policies = [p for p in account_policies if p['PolicyName'].startswith('policy-')]
+        self.assertEqual(len(customer_policies), 10)
+        for policy in customer_policies:
+            self.assertEqual(policy['Description'], f"Policy number {policy['PolicyName'].split('-')[1]}")
+        self.assertEqual(next(r for r in account_roles if r['RoleName'] == 'bc-role')['Description'], 'A role')
+
+    @mock_iam
+    def test_add_login_profiles(self):
+        with patch.dict('os.environ', {"AWS_ACCESS_KEY_ID": "FAKE", "AWS_SECRET_ACCESS_KEY": "FAKE", "AWS_DEFAULT_REGION": "us-east-1"}):
+            client = boto3.client('iam')
+            self.create_user(client, 'reported-user')
+            self.create_user(client, 'new-user')
+            client.create_user(Path='/', UserName='new-user-without-password')
+            account_users = [client.get_user(UserName=user_name)['User']
+                             for user_name in ['reported-user', 'new-user', 'new-user-without-password']]
+            credential_report = [{
+                'user': 'reported-user',
+                'user_creation_time': account_users[0]['CreateDate'].replace(microsecond=0).isoformat(),
+                # Deliberately contradicts the login profile, to verify the report is used instead of the API
+                'password_enabled': 'false'
+            }]
+            RuntimeIamScanner._add_login_profiles(client, account_users, credential_report)
+        self.assertListEqual([user['LoginProfileExists'] for user in account_users], [False, True, False])
+
+    @patch('airiam.find_unused.RuntimeIamScanner.time.sleep')
+    def test_generate_last_access_polls_all_jobs(self, sleep_mock):
+        arns = [f'arn:aws:iam::000000000000:user/user{i}' for i in range(3)]
+        polls = {}
+
+        def get_service_last_accessed_details(JobId, Marker=None):
+            polls[JobId] = polls.get(JobId, 0) + 1
+            if polls[JobId] < int(JobId):
+                return {'JobStatus': 'IN_PROGRESS'}
+            if Marker is None and JobId == '3':
+                return {'JobStatus': 'COMPLETED', 'IsTruncated': True, 'Marker': 'next',
+                        'ServicesLastAccessed': [{'ServiceNamespace': 's3', 'LastAuthenticated': '2020-01-01', 'TotalAuthenticatedEntities': 1}]}
+            return {'JobStatus': 'COMPLETED', 'IsTruncated': False,
+                    'ServicesLastAccessed': [{'ServiceNamespace': 'ec2', 'LastAuthenticated': '2020-01-01', 'TotalAuthenticatedEntities': 1}]}
+
+        iam = MagicMock()
+        iam.generate_service_last_accessed_details.side_effect = lambda Arn: {'JobId': str(int(Arn[-1]) + 1)}
+        iam.get_service_last_accessed_details.side_effect = get_service_last_accessed_details
+        results = RuntimeIamScanner(configure_logger())._generate_last_access(iam, arns)
+        self.assertEqual(iam.generate_service_last_accessed_details.call_count, 3)
+        self.assertEqual(sleep_mock.call_count, 2)
+        self.assertListEqual([c[0][0] for c in sleep_mock.call_args_list], [1, 2])
+        self.assertEqual(len(results[arns[0]]), 1)
+        self.assertListEqual([s['ServiceNamespace'] for s in results[arns[2]]], ['s3', 'ec2'])
+
+    @patch('airiam.find_unused.RuntimeIamScanner.time.sleep')
+    @patch('airiam.find_unused.RuntimeIamScanner.LAST_ACCESSED_DEADLINE', 0)
+    def test_generate_last_access_deadline(self, _):
+        arns = ['arn:aws:iam::000000000000:user/user0', 'arn:aws:iam::000000000000:user/user1']
+        iam = MagicMock()
+        iam.generate_service_last_accessed_details.side_effect = lambda Arn: {'JobId': Arn[-1]}
+        iam.get_service_last_accessed_details.side_effect = lambda JobId, Marker=None: {'JobStatus': 'IN_PROGRESS'} if JobId == '1' else {
+            'JobStatus': 'COMPLETED', 'IsTruncated': False,
+            'ServicesLastAccessed': [{'ServiceNamespace': 'ec2', 'LastAuthenticated': '2020-01-01', 'TotalAuthenticatedEntities': 1}]}
+        logger = MagicMock()
+        results = RuntimeIamScanner(logger)._generate_last_access(iam, arns)
+        self.assertListEqual(list(results.keys()), [arns[0]])
+        self.assertIn(arns[1], logger.warning.call_args[0][0])
+
+    @mock_iam
+    def test_asyncio_collection_backend(self):
+        with patch.dict('os.environ', {"AWS_ACCESS_KEY_ID": "FAKE", "AWS_SECRET_ACCESS_KEY": "FAKE", "AWS_DEFAULT_REGION": "us-east-1"}):
             client = boto3.client('iam')
             self.create_user(client, 'test@bridgecrew.io')
             self.create_role(client, 'bc-role', ADMIN_POLICY_ARN)
-            self.create_role(client, 'bc-role2', READ_ONLY_ARN)
             client.create_group(GroupName='admins', Path='/')
-            client.attach_group_policy(GroupName='admins', PolicyArn=ADMIN_POLICY_ARN)
-            client.create_group(GroupName='read-only', Path='/')
-            client.attach_group_policy(GroupName='read-only', PolicyArn=READ_ONLY_ARN)
             client.add_user_to_group(GroupName='admins', UserName='test@bridgecrew.io')
-            client.add_user_to_group(GroupName='read-only', UserName='test@bridgecrew.io')
-            logger = configure_logger()
-            iam_data = RuntimeIamScanner(logger)._get_data_from_aws("000000000000", False)
-        self.assertTrue(len(iam_data.keys()) == 5)
+            scanner = RuntimeIamScanner(configure_logger(), collection_backend='asyncio', managed_policy_catalog=self.managed_policy_catalog)
+            async_iam_data = asyncio.run(scanner._collect_iam_data_async(client, False))
+            sync_iam_data = scanner._collect_iam_data(client, False)
+        self.assertEqual(json.dumps(async_iam_data, sort_keys=True, default=str), json.dumps(sync_iam_data, sort_keys=True, default=str))
+        self.assertEqual(async_iam_data['AccountUsers'][0]['LoginProfileExists'], True)
+        self.assertEqual(async_iam_data['AccountRoles'][0]['Description'], '')
+
+    @mock_iam
+    def test_aws_managed_policies_are_fetched_once(self):
+        with tempfile.TemporaryDirectory() as temp_dir, \
+                patch.dict('os.environ', {"AWS_ACCESS_KEY_ID": "FAKE", "AWS_SECRET_ACCESS_KEY": "FAKE", "AWS_DEFAULT_REGION": "us-east-1"}):
+            client = boto3.client('iam')
+            self.create_role(client, 'bc-role', READ_ONLY_ARN)
+            catalog = ManagedPolicyCatalog(temp_dir)
+            with patch.object(client, 'get_policy_version', wraps=client.get_policy_version) as get_policy_version_mock:
+                policies = RuntimeIamScanner._get_aws_managed_policies(client, catalog)
+                cached_policies = RuntimeIamScanner._get_aws_managed_policies(client, catalog)
+        get_policy_version_mock.assert_called_once()
+        self.assertListEqual([policy['Arn'] for policy in policies], [READ_ONLY_ARN])
+        self.assertEqual(json.dumps(policies, sort_keys=True, default=str), json.dumps(cached_policies, sort_keys=True, default=str))
+        self.assertTrue(policies[0]['PolicyVersionList'][0]['IsDefaultVersion'])
+        self.assertIn('Statement', policies[0]['PolicyVersionList'][0]['Document'])
+
+    @patch('airiam.find_unused.RuntimeIamScanner.time.sleep')
+    def test_get_credential_report_waits_for_completion(self, sleep_mock):
+        iam = MagicMock()
+        iam.generate_credential_report.side_effect = [{'State': 'STARTED'}, {'State': 'INPROGRESS'}, {'State': 'COMPLETE'}]
+        iam.get_credential_report.return_value = {'Content': b'user,password_enabled\nuser1,true'}
+        credential_report = RuntimeIamScanner._get_credential_report(iam)
+        self.assertListEqual([c[0][0] for c in sleep_mock.call_args_list], [1, 2])
+        self.assertEqual(credential_report['user1']['password_enabled'], 'true')
+
+    def test_start_credential_report_generation(self):
+        fresh_report = {'Content': b'user,password_enabled\nuser1,true',
+                        'GeneratedTime': datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(minutes=5)}
+        iam = MagicMock()
+        iam.get_credential_report.return_value = fresh_report
+        self.assertIn('user1', RuntimeIamScanner._start_credential_report_generation(iam))
+        iam.generate_credential_report.assert_not_called()
+
+        iam.get_credential_report.return_value = {**fresh_report, 'GeneratedTime': fresh_report['GeneratedTime'] - datetime.timedelta(days=1)}
+        self.assertIsNone(RuntimeIamScanner._start_credential_report_generation(iam))
+        iam.generate_credential_report.assert_called_once()
+
+    def test_incremental_last_accessed(self):
+        def principal(name, policy_arn):
+            return {'Arn': f'arn:aws:iam::000000000000:user/{name}', 'UserName': name, 'GroupList': [],
+                    'AttachedManagedPolicies': [{'PolicyArn': policy_arn}]}
+
+        scanner = RuntimeIamScanner(configure_logger(), incremental=True)
+        previous_principals = [principal('unchanged', READ_ONLY_ARN), principal('changed', READ_ONLY_ARN), principal('expired', READ_ONLY_ARN)]
+        for previous_principal in previous_principals:
+            previous_principal['PolicyHash'] = RuntimeIamScanner._get_policy_hash(previous_principal)
+            previous_principal['LastAccessed'] = [{'ServiceNamespace': 'cached', 'LastAccessed': '2020-01-01T00:00:00+00:00'}]
+            previous_principal['LastAccessedTime'] = int(time.time())
+        previous_principals[2]['LastAccessedTime'] -= 2 * LAST_ACCESSED_TTL
+        scanner._previous_principals = {p['Arn']: p for p in previous_principals}
+
+        account_principals = [principal('unchanged', READ_ONLY_ARN), principal('changed', ADMIN_POLICY_ARN), principal('expired', READ_ONLY_ARN),
+                              principal('new', READ_ONLY_ARN)]
+        with patch.object(scanner, '_generate_last_access', side_effect=lambda iam, arns: {arn: [] for arn in arns}) as generate_mock:
+            scanner._add_last_accessed(MagicMock(), account_principals)
+        self.assertListEqual(generate_mock.call_args[0][1], [p['Arn'] for p in account_principals[1:]])
+        self.assertEqual(account_principals[0]['LastAccessed'][0]['ServiceNamespace'], 'cached')
+        for refreshed_principal in account_principals[1:]:
+            self.assertListEqual(refreshed_principal['LastAccessed'], [])
 
     @staticmethod
     def create_user(client, user_name):
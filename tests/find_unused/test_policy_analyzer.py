@@ -0,0 +1,54 @@
+import unittest
+
+from airiam.find_unused.ActionTable import ActionTable
+from airiam.find_unused.PolicyAnalyzer import PolicyAnalyzer, PolicyAnalysisCache
+
+
+class TestPolicyAnalyzer(unittest.TestCase):
+    def test_bundled_action_table(self):
+        services = ActionTable.get_services()
+        self.assertEqual(services['s3']['GetObject'], 'Read')
+        self.assertEqual(services['iam']['CreateUser'], 'Permissions management')
+
+    def test_compact_action_table(self):
+        iam_definition = {
+            'policy_sentry_schema_version': 'v2',
+            's3': {'privileges': {'GetObject': {'privilege': 'GetObject', 'access_level': 'Read'}}}
+        }
+        self.assertDictEqual(ActionTable.compact(iam_definition), {'SchemaVersion': 1, 'Services': {'s3': {'GetObject': 'Read'}}})
+
+    def test_access_levels_lookup(self):
+        self.assertSetEqual(set(ActionTable.get_access_levels('s3', 'GetObject')), {'Read'})
+        self.assertSetEqual(set(ActionTable.get_access_levels('s3', 'getobject')), {'Read'})
+        self.assertSetEqual(set(ActionTable.get_access_levels('s3', 'Get')), set())
+        self.assertSetEqual(set(ActionTable.get_access_levels('s3', 'Get*Tagging')), {'Read'})
+        self.assertIn('Write', ActionTable.get_access_levels('s3', 'Put*'))
+        self.assertSetEqual(set(ActionTable.get_access_levels('no-such-service', 'Get*')), set())
+
+    def test_policy_is_write_access(self):
+        read_policy = {'Statement': [{'Effect': 'Allow', 'Action': ['s3:Get*', 's3:List*'], 'Resource': '*'}]}
+        write_policy = {'Statement': {'Effect': 'Allow', 'Action': 's3:Put*', 'Resource': '*'}}
+        self.assertFalse(PolicyAnalyzer.policy_is_write_access(read_policy))
+        self.assertTrue(PolicyAnalyzer.policy_is_write_access(write_policy))
+        self.assertTrue(PolicyAnalyzer.policy_is_write_access({'Statement': [{'Effect': 'Allow', 'Action': 's3:*', 'Resource': '*'}]}))
+
+    def test_policy_analysis_cache(self):
+        policy_obj = {
+            'Arn': 'arn:aws:iam::aws:policy/AmazonS3ReadOnlyAccess',
+            'DefaultVersionId': 'v1',
+            'PolicyVersionList': [
+                {'VersionId': 'v1', 'IsDefaultVersion': True,
+                 'Document': {'Statement': [{'Effect': 'Allow', 'Action': ['s3:List*'], 'Resource': '*'}]}}
+            ]
+        }
+        cache = PolicyAnalysisCache()
+        analysis = cache.get_analysis(policy_obj)
+        self.assertIs(analysis, cache.get_analysis(policy_obj))
+        self.assertSetEqual(set(analysis.services), {'s3'})
+        self.assertTrue(analysis.is_unused(['ec2']))
+        self.assertFalse(analysis.is_unused(['ec2', 's3']))
+        self.assertFalse(analysis.is_write_access())
+
+
+if __name__ == '__main__':
+    unittest.main()
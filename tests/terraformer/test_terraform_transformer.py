@@ -1,10 +1,16 @@
+import copy
 import json
 import os
+import re
+import tempfile
 import unittest
+from unittest.mock import MagicMock, patch
 
 from airiam.main import configure_logger
 from airiam.models.RuntimeReport import RuntimeReport
+from airiam.terraform.TerraformStateWriter import TerraformStateWriter
 from airiam.terraform.TerraformTransformer import TerraformTransformer
+from airiam.terraform.entity_terraformers.IAMRoleTransformer import IAMRoleTransformer
 
 
 class TestTerraformTransformer(unittest.TestCase):
@@ -17,6 +23,117 @@ class TestTerraformTransformer(unittest.TestCase):
     #     self.assertTrue(os.path.exists('results/users.tf'), 'Did not create a users file')
     #     self.assertTrue(os.path.exists('results/policies.tf'), 'Did not create a policies file')
 
+    def test_write_import_blocks(self):
+        self.setup()
+        with tempfile.TemporaryDirectory() as result_dir:
+            terraform_transformer = TerraformTransformer(configure_logger(), result_dir=result_dir)
+            entities_to_transform = terraform_transformer._list_entities_to_transform(self.report, False, True)
+            entities_to_import = terraform_transformer.write_terraform_code(entities_to_transform)
+            terraform_transformer.write_import_blocks(entities_to_import)
+            code = ''
+            for file_name in os.listdir(result_dir):
+                if file_name != 'imports.tf':
+                    with open(os.path.join(result_dir, file_name)) as code_file:
+                        code += code_file.read()
+            with open(os.path.join(result_dir, 'imports.tf')) as imports_file:
+                import_blocks = re.findall(r'import {\n  to = (\S+)\n  id = (".*")\n}', imports_file.read())
+        resource_addresses = {f'{resource_type.strip(chr(34))}.{name}' for resource_type, name in re.findall(r'resource ("?\w+"?) "([^"]+)"', code)}
+        self.assertEqual(len(import_blocks), len(entities_to_import))
+        for (address, entity_id), entity_to_import in zip(import_blocks, entities_to_import):
+            self.assertIn(address, resource_addresses)
+            self.assertEqual(json.loads(entity_id), entity_to_import['entity'])
+
+    def test_write_state(self):
+        self.setup()
+        with tempfile.TemporaryDirectory() as result_dir:
+            terraform_transformer = TerraformTransformer(configure_logger(), result_dir=result_dir)
+            entities_to_transform = terraform_transformer._list_entities_to_transform(self.report, False, True)
+            entities_to_import = terraform_transformer.write_terraform_code(entities_to_transform)
+            state_writer = TerraformStateWriter(result_dir)
+            state = state_writer.write(entities_to_import)
+            self.assertListEqual(state_writer.verify(None), [])
+            addresses = [f'{resource["type"]}.{resource["name"]}' for resource in state['resources']]
+            self.assertListEqual(addresses, sorted({entity_to_import['identifier'] for entity_to_import in entities_to_import}))
+            for resource in state['resources']:
+                self.assertIn('id', resource['instances'][0]['attributes'])
+            rewritten_state = state_writer.write(entities_to_import)
+            self.assertEqual(rewritten_state['lineage'], state['lineage'])
+            self.assertEqual(rewritten_state['serial'], state['serial'] + 1)
+            self.assertTrue(os.path.exists(f'{state_writer.state_file}.backup'))
+            os.remove(os.path.join(result_dir, 'users.tf'))
+            self.assertGreater(len(state_writer.verify(None)), 0)
+
+    def test_verify_state_plan(self):
+        plan = {'resource_changes': [
+            {'address': 'aws_iam_user.user1', 'change': {'actions': ['update']}},
+            {'address': 'aws_iam_user.user2', 'change': {'actions': ['create']}},
+            {'address': 'aws_iam_role.role1', 'change': {'actions': ['delete', 'create']}},
+            {'address': 'aws_iam_group.group1', 'change': {'actions': ['no-op']}}
+        ]}
+        with tempfile.TemporaryDirectory() as result_dir:
+            state_writer = TerraformStateWriter(result_dir)
+            tf = MagicMock()
+            tf.plan.return_value = (2, '', '')
+            tf.cmd.return_value = (0, json.dumps(plan), '')
+            self.assertListEqual(state_writer.verify(tf), ['terraform plan would create aws_iam_user.user2',
+                                                           'terraform plan would replace aws_iam_role.role1'])
+            tf.plan.return_value = (0, '', '')
+            self.assertListEqual(state_writer.verify(tf), [])
+            tf.plan.return_value = (1, '', 'Error: invalid state')
+            self.assertListEqual(state_writer.verify(tf), ['terraform plan failed: Error: invalid state'])
+
+    def test_skip_managed_entities(self):
+        self.setup()
+        with tempfile.TemporaryDirectory() as result_dir:
+            terraform_transformer = TerraformTransformer(configure_logger(), result_dir=result_dir)
+            entities_to_transform = terraform_transformer._list_entities_to_transform(self.report, False, True)
+            entities_to_import = terraform_transformer.write_terraform_code(entities_to_transform)
+            self.assertListEqual(terraform_transformer._skip_managed_entities(entities_to_import), entities_to_import)
+            managed_entities = entities_to_import[:len(entities_to_import) // 2]
+            TerraformStateWriter(result_dir).write(managed_entities)
+            new_entities = terraform_transformer._skip_managed_entities(entities_to_import)
+        managed_addresses = {entity_to_import['identifier'] for entity_to_import in managed_entities}
+        self.assertGreater(len(new_entities), 0)
+        self.assertListEqual(new_entities, [entity_to_import for entity_to_import in entities_to_import
+                                            if entity_to_import['identifier'] not in managed_addresses])
+
+    def test_write_terraform_code_streams_chunks(self):
+        self.setup()
+        with tempfile.TemporaryDirectory() as result_dir:
+            terraform_transformer = TerraformTransformer(configure_logger(), result_dir=result_dir)
+            entities_to_transform = terraform_transformer._list_entities_to_transform(self.report, False, True)
+            roles = sorted(copy.deepcopy(entities_to_transform['Roles']), key=lambda role: role['RoleName'])
+            terraform_transformer.write_terraform_code(entities_to_transform)
+            with open(os.path.join(result_dir, 'roles.tf')) as roles_file:
+                roles_code = roles_file.read()
+        role_transformers = [IAMRoleTransformer(role) for role in roles]
+        self.assertGreater(len(list(role_transformers[0].code_chunks())), 1)
+        self.assertEqual(roles_code, ''.join(transformer.code() for transformer in role_transformers))
+
+    def test_write_terraform_code_is_deterministic(self):
+        self.setup()
+        raw_data = self.report.get_raw_data()
+        codes = []
+        for max_processes, chunk_size in [(1, 50), (4, 3)]:
+            report = RuntimeReport(self.report.account_id, 'arn:aws:iam::012345678901:user/testuser', copy.deepcopy(raw_data))
+            report.set_unused([], [], [], [], [], [], [])
+            with tempfile.TemporaryDirectory() as result_dir, patch('airiam.terraform.TerraformTransformer.MAX_PROCESSES', max_processes), \
+                    patch('airiam.terraform.TerraformTransformer.CODE_GENERATION_CHUNK_SIZE', chunk_size), \
+                    patch('airiam.terraform.TerraformTransformer.IamDataCache.wait_for_pending_writes') as wait_mock:
+                terraform_transformer = TerraformTransformer(configure_logger(), result_dir=result_dir)
+                entities_to_import = terraform_transformer.write_terraform_code(terraform_transformer._list_entities_to_transform(report, False, True))
+                # The cache writer thread must be done before the worker processes are forked
+                self.assertEqual(wait_mock.call_count, 1 if max_processes > 1 else 0)
+                code = {}
+                for file_name in sorted(os.listdir(result_dir)):
+                    with open(os.path.join(result_dir, file_name)) as code_file:
+                        code[file_name] = code_file.read()
+            codes.append((code, entities_to_import))
+        self.assertDictEqual(codes[0][0], codes[1][0])
+        self.assertListEqual(codes[0][1], codes[1][1])
+        role_names = [entity_to_import['entity'] for entity_to_import in codes[0][1] if entity_to_import['identifier'].startswith('aws_iam_role.')]
+        self.assertListEqual(role_names, sorted(role_names))
+
     def setup(self):
         self.unused_users = []
         self.unused_roles = []
@@ -12,13 +12,33 @@ class TestAiriam(unittest.TestCase):
         self.assertIsNone(args.profile)
         self.assertFalse(args.no_cache)
         self.assertEqual(args.output, OutputFormat.cli)
+        self.assertEqual(args.collection_backend, 'sync')
+        self.assertFalse(args.incremental)
+        self.assertIsNone(args.max_cache_age)
+        self.assertIsNone(args.accounts)
+        self.assertFalse(args.interactive)
+
+    def test_arg_parser_find_unused_accounts(self):
+        args = parse_args(['find_unused', '-p', 'org', '--accounts', 'dev', 'arn:aws:iam::111111111111:role/AirIAM'])
+        self.assertEqual(args.profile, 'org')
+        self.assertListEqual(args.accounts, ['dev', 'arn:aws:iam::111111111111:role/AirIAM'])
+
+    def test_arg_parser_find_unused_output(self):
+        args = parse_args(['find_unused', '-o', 'sarif', '--output-file', 'airiam.sarif'])
+        self.assertEqual(args.output, OutputFormat.sarif)
+        self.assertEqual(args.output_file, 'airiam.sarif')
+        self.assertEqual(parse_args(['find_unused', '-o', 'cli']).output, OutputFormat.cli)
+        self.assertTrue(parse_args(['find_unused', '--pace']).interactive)
+        self.assertIsNone(parse_args(['find_unused']).output_file)
 
     def test_arg_parser_find_unused_custom(self):
-        args = parse_args(['find_unused', '-p', 'dev', '-l', '30', '--no-cache'])
+        args = parse_args(['find_unused', '-p', 'dev', '-l', '30', '--no-cache', '--collection-backend', 'asyncio', '--max-cache-age', '12'])
         self.assertEqual(args.command, 'find_unused')
         self.assertEqual(args.last_used_threshold, 30)
         self.assertEqual(args.profile, 'dev')
         self.assertTrue(args.no_cache)
+        self.assertEqual(args.collection_backend, 'asyncio')
+        self.assertEqual(args.max_cache_age, 12)
 
     def test_arg_parser_recommend_groups_default(self):
         args = parse_args(['find_unused'])
@@ -45,10 +65,11 @@ class TestAiriam(unittest.TestCase):
         self.assertFalse(args.no_cache)
         self.assertFalse(args.without_groups)
         self.assertFalse(args.without_import)
+        self.assertEqual(args.import_mode, 'cli')
 
     def test_arg_parser_terraform_custom(self):
         args = parse_args(['terraform', '-p', 'dev', '--without-unused', '-l', '30', '--no-cache', '-d', 'tf_res', '--without-groups',
-                           '--without-import'])
+                           '--without-import', '--import-mode', 'blocks'])
         self.assertEqual(args.command, 'terraform')
         self.assertEqual(args.last_used_threshold, 30)
         self.assertTrue(args.without_unused)
@@ -57,3 +78,4 @@ class TestAiriam(unittest.TestCase):
         self.assertTrue(args.no_cache)
         self.assertTrue(args.without_groups)
         self.assertTrue(args.without_import)
+        self.assertEqual(args.import_mode, 'blocks')
@@ -0,0 +1,84 @@
+import io
+import json
+import unittest
+from unittest.mock import patch
+
+from airiam.Reporter import Reporter, OutputFormat
+from airiam.models.ConsolidatedReport import ConsolidatedReport
+from airiam.models.RuntimeReport import RuntimeReport
+
+
+class TestReporter(unittest.TestCase):
+    def setUp(self):
+        self.report = RuntimeReport('000000000000', 'arn:aws:iam::000000000000:user/testuser', {})
+        unused_users = [{'UserName': 'user1', 'Arn': 'arn:aws:iam::000000000000:user/user1', 'LastUsed': -1}]
+        unused_access_keys = [{'User': 'user2', 'AccessKey': '1', 'DaysSinceLastUse': 120}]
+        unused_console_login_profiles = [{'User': 'user2', 'MFAEnabled': False, 'DaysSinceLastUse': 100}]
+        redundant_groups = [{'GroupName': 'group1', 'AttachedManagedPolicies': [], 'GroupPolicyList': []}]
+        unused_policy_attachments = [{'Role': 'role1', 'PolicyArn': 'arn:aws:iam::aws:policy/ReadOnlyAccess'}]
+        self.report.set_unused(unused_users, [], unused_access_keys, unused_console_login_profiles, [], redundant_groups, unused_policy_attachments)
+
+    def write(self, output_format: OutputFormat) -> str:
+        output = io.StringIO()
+        with patch('airiam.Reporter.time.sleep') as sleep_mock:
+            Reporter.write_unused(self.report, output_format, output)
+        sleep_mock.assert_not_called()
+        return output.getvalue()
+
+    def test_report_unused_renders_immediately(self):
+        with patch('airiam.Reporter.time.sleep') as sleep_mock, patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            Reporter.report_unused(self.report)
+            Reporter.report_unused(self.report, interactive=True)
+        sleep_mock.assert_not_called()
+        self.assertIn('user1', stdout.getvalue())
+        self.assertIn('group1', stdout.getvalue())
+
+    def test_report_unused_interactive(self):
+        stdout = io.StringIO()
+        stdout.isatty = lambda: True
+        with patch('airiam.Reporter.time.sleep') as sleep_mock, patch('sys.stdout', stdout):
+            Reporter.report_unused(self.report, interactive=True)
+        self.assertGreater(sleep_mock.call_count, 0)
+
+    def test_report_unused_consolidated(self):
+        other_report = RuntimeReport('111111111111', 'arn:aws:iam::111111111111:user/testuser', {})
+        other_report.set_unused([{'UserName': 'user3', 'Arn': 'arn:aws:iam::111111111111:user/user3', 'LastUsed': 200}], [], [], [], [], [], [])
+        with patch('sys.stdout', new_callable=io.StringIO) as stdout:
+            Reporter.report_unused(ConsolidatedReport([other_report, self.report]))
+        output = stdout.getvalue()
+        first_account, second_account = output.index('Account 000000000000'), output.index('Account 111111111111')
+        self.assertLess(first_account, output.index('user1'))
+        self.assertLess(output.index('user1'), second_account)
+        self.assertLess(second_account, output.index('user3'))
+        self.assertEqual(output.count('https://www.bridgecrew.io/'), 1)
+
+    def test_write_json(self):
+        unused = json.loads(self.write(OutputFormat.json))
+        self.assertDictEqual(unused, self.report.get_unused())
+
+    def test_write_jsonl(self):
+        findings = [json.loads(line) for line in self.write(OutputFormat.jsonl).splitlines()]
+        self.assertListEqual([finding['FindingType'] for finding in findings],
+                             ['UnusedUser', 'UnusedActiveAccessKey', 'UnusedConsoleLoginProfile', 'RedundantGroup', 'UnusedPolicyAttachment'])
+        self.assertEqual(findings[0]['UserName'], 'user1')
+
+    def test_write_sarif(self):
+        sarif = json.loads(self.write(OutputFormat.sarif))
+        self.assertEqual(sarif['version'], '2.1.0')
+        run = sarif['runs'][0]
+        rule_ids = {rule['id'] for rule in run['tool']['driver']['rules']}
+        self.assertEqual(len(run['results']), 5)
+        for result in run['results']:
+            self.assertIn(result['ruleId'], rule_ids)
+        self.assertEqual(run['results'][0]['locations'][0]['logicalLocations'][0]['fullyQualifiedName'], 'arn:aws:iam::000000000000:user/user1')
+        self.assertIn('WITHOUT MFA', run['results'][2]['message']['text'])
+
+    def test_write_empty_report(self):
+        self.report.set_unused([], [], [], [], [], [], [])
+        self.assertDictEqual(json.loads(self.write(OutputFormat.json)), self.report.get_unused())
+        self.assertEqual(self.write(OutputFormat.jsonl), '')
+        self.assertListEqual(json.loads(self.write(OutputFormat.sarif))['runs'][0]['results'], [])
+
+
+if __name__ == '__main__':
+    unittest.main()